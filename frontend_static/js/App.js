@@ -13,6 +13,7 @@ function App() {
     });
     const [retrievedDocs, setRetrievedDocs] = useState([]);
     const [expandedDocs, setExpandedDocs] = useState({});
+    const [fullContents, setFullContents] = useState({});
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState(null);
     const [showStructured, setShowStructured] = useState(true);
@@ -34,17 +35,16 @@ function App() {
                     structured_locations: [],
                     structured_time_periods: [],
                     structured_rulers_or_polities: [],
-                    full_document_contents: ["Mock document 1 content.", "Another sample document content."],
                     retrieved_documents: [
-                        { id: "doc1", score: 0.98 },
-                        { id: "doc2", score: 0.87 }
+                        { id: "doc1", score: 0.98, content_snippet: "Mock document 1 content.", truncated: false },
+                        { id: "doc2", score: 0.87, content_snippet: "Another sample document content.", truncated: false }
                     ]
                 };
             } else {
                 const res = await fetch('/api/rag-query/', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ query, embedding })
+                    body: JSON.stringify({ query, embedding, compact: true })
                 });
 
                 data = await res.json();
@@ -54,9 +54,11 @@ function App() {
             const newPair = {
                 question: query,
                 answer: data.answer,
-                documents: data.full_document_contents.map((content, i) => ({
-                    content,
-                    meta: data.retrieved_documents[i]
+                // Snippets only; the full text is fetched when a document is expanded
+                // Falls back to full_document_contents for servers that still send full responses
+                documents: data.retrieved_documents.map((meta, i) => ({
+                    content: meta.content_snippet ?? data.full_document_contents?.[i] ?? '',
+                    meta: { ...meta, embedding }
                 }))
             };
 
@@ -88,6 +90,7 @@ function App() {
         });
         setRetrievedDocs([]);
         setExpandedDocs({});
+        setFullContents({});
         setError(null);
     };
 
@@ -96,8 +99,19 @@ function App() {
         handleClear();
     };
 
-    const toggleExpand = (index) => {
-        setExpandedDocs((prev) => ({ ...prev, [index]: !prev[index] }));
+    const toggleExpand = async (index, doc) => {
+        const expanding = !expandedDocs[index];
+        setExpandedDocs((prev) => ({ ...prev, [index]: expanding }));
+        if (!expanding || !doc.meta?.id || fullContents[doc.meta.id] !== undefined) return;
+
+        try {
+            const res = await fetch(`/api/documents/${encodeURIComponent(doc.meta.id)}/?embedding=${doc.meta.embedding}`);
+            if (!res.ok) throw new Error('Document fetch failed');
+            const data = await res.json();
+            setFullContents((prev) => ({ ...prev, [doc.meta.id]: data.content }));
+        } catch (err) {
+            setFullContents((prev) => ({ ...prev, [doc.meta.id]: doc.content }));
+        }
     };
 
     const hasStructuredInfo =
@@ -181,12 +195,12 @@ function App() {
                                         </div>
                                         <p className="mt-2 text-gray-800">
                                             {expandedDocs[i]
-                                                ? doc.content
-                                                : doc.content.slice(0, 300) + (doc.content.length > 300 ? '...' : '')
+                                                ? (fullContents[doc.meta?.id] ?? doc.content)
+                                                : doc.content.slice(0, 300) + ((doc.meta?.truncated ?? doc.content.length > 300) ? '...' : '')
                                             }
                                         </p>
                                         <button
-                                            onClick={() => toggleExpand(i)}
+                                            onClick={() => toggleExpand(i, doc)}
                                             className="text-blue-500 mt-1 text-sm hover:underline"
                                         >
                                             {expandedDocs[i] ? 'Show Less' : 'Show More'}
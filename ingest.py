@@ -1,9 +1,15 @@
 from haystack import Pipeline
 from haystack_integrations.document_stores.chroma import ChromaDocumentStore
 from haystack.components.converters import PDFMinerToDocument
-from haystack.components.preprocessors import DocumentCleaner, DocumentSplitter
+from haystack.components.preprocessors import DocumentCleaner
 from haystack.components.embedders import SentenceTransformersDocumentEmbedder
 from haystack.components.writers import DocumentWriter
+from map_api.store_versions import new_version, publish_version
+from map_api.chunking import build_splitter
+from map_api.dedup import NearDuplicateFilter
+from map_api.sharding import ShardedDocumentWriter, shard_paths
+from map_api.quantization import compress_store
+from map_project.settings import EMBEDDING_MODELS
 import os
 from datetime import datetime
 import logging
@@ -20,29 +26,50 @@ def get_file_names_in_folder(folder_path):
     ]
 
 file_names = get_file_names_in_folder("./data/pdfs/")
-CHHROMA_SAVEPATH = "./data/chroma_db"
-split_by = "sentence"
-split_length = 10
+CHROMA_BASE_PATH = "./data/chroma_db"
+# Build into a fresh version; running workers pick it up once it is published
+store_version, CHHROMA_SAVEPATH = new_version(CHROMA_BASE_PATH)
+MODEL_CONFIG = EMBEDDING_MODELS["mpnet"]
+split_by = "tokens"  # or "sentence" for the fixed split_length/split_overlap in MODEL_CONFIG
 timestamp_str = datetime.now().strftime("%Y%m%d-%H%M%S")
+DEDUP_THRESHOLD = 0.85  # Estimated Jaccard similarity above which chunks are folded
 
-chroma_store = ChromaDocumentStore(persist_path=CHHROMA_SAVEPATH, distance_function='cosine')
+SHARDS = MODEL_CONFIG.get("shards", 1)
+COMPRESSION = MODEL_CONFIG.get("compression")
+store_paths = shard_paths(CHHROMA_SAVEPATH, SHARDS)
+chroma_stores = [ChromaDocumentStore(persist_path=path, distance_function='cosine') for path in store_paths]
 
 pipe = Pipeline()
 pipe.add_component("converter", PDFMinerToDocument())
 pipe.add_component("cleaner", DocumentCleaner())
-pipe.add_component("splitter", DocumentSplitter(split_by=split_by, split_length=split_length))
-pipe.add_component("embedder", SentenceTransformersDocumentEmbedder(model="sentence-transformers/all-mpnet-base-v2"))
-pipe.add_component("writer", DocumentWriter(document_store=chroma_store))
+pipe.add_component("splitter", build_splitter(MODEL_CONFIG, split_by))
+pipe.add_component("dedup", NearDuplicateFilter(
+    threshold=DEDUP_THRESHOLD, report_path=f"./data/output/dedup_report_mpnet_{timestamp_str}.json"
+))
+pipe.add_component("embedder", SentenceTransformersDocumentEmbedder(model=MODEL_CONFIG["name"]))
+if SHARDS > 1:
+    pipe.add_component("writer", ShardedDocumentWriter(chroma_stores, shard_key=MODEL_CONFIG.get("shard_key", "file")))
+else:
+    pipe.add_component("writer", DocumentWriter(document_store=chroma_stores[0]))
 
 pipe.connect("converter", "cleaner")
 pipe.connect("cleaner", "splitter")
-pipe.connect("splitter", "embedder")
+pipe.connect("splitter", "dedup")
+pipe.connect("dedup", "embedder")
 pipe.connect("embedder", "writer")
 
 try:
-    logging.info(f"Initial document count: {chroma_store.count_documents()}")
+    logging.info(f"Initial document count: {sum(store.count_documents() for store in chroma_stores)}")
     pipe.run({"converter": {"sources": file_names}})
-    logging.info(f"Updated document count: {chroma_store.count_documents()}")
+    logging.info(f"Updated document count: {sum(store.count_documents() for store in chroma_stores)} across {SHARDS} shard(s)")
+    if split_by == "tokens":
+        logging.info(f"Chunk length distribution (tokens): {pipe.get_component('splitter').report()}")
+    # The compact index is written beside Chroma's own files: more disk, less RAM when serving
+    if COMPRESSION:
+        for store, path in zip(chroma_stores, store_paths):
+            compress_store(store, path, metric="cosine", **COMPRESSION)
+    publish_version(CHROMA_BASE_PATH, store_version)
+    logging.info(f"Published store version {store_version}")
 except Exception as e:
     logging.error(f"Pipeline error: {e}", exc_info=True)
 
@@ -1,30 +1,53 @@
 from haystack import Pipeline
 from haystack_integrations.document_stores.chroma import ChromaDocumentStore
 from haystack.components.converters import PyPDFToDocument
-from haystack.components.preprocessors import DocumentCleaner, DocumentSplitter
+from haystack.components.preprocessors import DocumentCleaner
 from haystack.components.writers import DocumentWriter
 from haystack.components.embedders import SentenceTransformersDocumentEmbedder
+from map_api.store_versions import new_version, publish_version
+from map_api.chunking import build_splitter
+from map_api.dedup import NearDuplicateFilter
+from map_api.sharding import ShardedDocumentWriter, shard_paths
+from map_api.quantization import compress_store
+from map_project.settings import EMBEDDING_MODELS
 import os
 import time
 import logging
+from datetime import datetime
 
 start_time = time.time()
-CHROMA_PATH = "./data/chroma_db_e5_embeddings"
+CHROMA_BASE_PATH = "./data/chroma_db_e5_embeddings"
+# Build into a fresh version; running workers pick it up once it is published
+store_version, CHROMA_PATH = new_version(CHROMA_BASE_PATH)
 PDF_DIR = "./data/pdfs"
+MODEL_CONFIG = EMBEDDING_MODELS["e5"]
+SPLIT_BY = "tokens"  # or "sentence" for the fixed split_length/split_overlap in MODEL_CONFIG
+DEDUP_THRESHOLD = 0.85  # Estimated Jaccard similarity above which chunks are folded
+timestamp_str = datetime.now().strftime("%Y%m%d-%H%M%S")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-document_store = ChromaDocumentStore(persist_path=CHROMA_PATH)
+SHARDS = MODEL_CONFIG.get("shards", 1)
+COMPRESSION = MODEL_CONFIG.get("compression")
+store_paths = shard_paths(CHROMA_PATH, SHARDS)
+document_stores = [ChromaDocumentStore(persist_path=path) for path in store_paths]
 
 pipeline = Pipeline()
 pipeline.add_component("cleaner", DocumentCleaner())
-pipeline.add_component("splitter", DocumentSplitter(split_by="sentence", split_length=10, split_overlap=2))
-pipeline.add_component("embedder", SentenceTransformersDocumentEmbedder(model="intfloat/e5-large-v2"))
-pipeline.add_component("writer", DocumentWriter(document_store=document_store))
+pipeline.add_component("splitter", build_splitter(MODEL_CONFIG, SPLIT_BY))
+pipeline.add_component("dedup", NearDuplicateFilter(
+    threshold=DEDUP_THRESHOLD, report_path=f"./data/output/dedup_report_e5_{timestamp_str}.json"
+))
+pipeline.add_component("embedder", SentenceTransformersDocumentEmbedder(model=MODEL_CONFIG["name"]))
+if SHARDS > 1:
+    pipeline.add_component("writer", ShardedDocumentWriter(document_stores, shard_key=MODEL_CONFIG.get("shard_key", "file")))
+else:
+    pipeline.add_component("writer", DocumentWriter(document_store=document_stores[0]))
 
 pipeline.connect("cleaner.documents", "splitter.documents")
-pipeline.connect("splitter.documents", "embedder.documents")
+pipeline.connect("splitter.documents", "dedup.documents")
+pipeline.connect("dedup.documents", "embedder.documents")
 pipeline.connect("embedder.documents", "writer.documents")
 
 pdf_paths = [os.path.join(PDF_DIR, f) for f in os.listdir(PDF_DIR) if f.endswith(".pdf")]
@@ -32,20 +55,34 @@ pdf_paths = [os.path.join(PDF_DIR, f) for f in os.listdir(PDF_DIR) if f.endswith
 print("Ingesting documents...")
 converter = PyPDFToDocument()
 
+# Convert everything first so near-duplicates are found across files, not just within one
+raw_docs = []
 for path in pdf_paths:
     logger.info(f"Processing {path}...")
-    raw_docs = converter.run(sources=[path])["documents"]
+    file_docs = converter.run(sources=[path])["documents"]
 
-    for doc in raw_docs:
+    for doc in file_docs:
         # Ensure meta field is initialized and includes filename
         if not hasattr(doc, "meta") or doc.meta is None:
             doc.meta = {}
         doc.meta["file_path"] = os.path.basename(path)
+    raw_docs.extend(file_docs)
 
-    # Pass through the rest of the pipeline
-    result = pipeline.run({"cleaner": {"documents": raw_docs}})
+# Pass through the rest of the pipeline
+result = pipeline.run({"cleaner": {"documents": raw_docs}})
 
 
+if SPLIT_BY == "tokens":
+    logger.info(f"Chunk length distribution (tokens): {pipeline.get_component('splitter').report()}")
+
+logger.info(f"Wrote {sum(store.count_documents() for store in document_stores)} chunks across {SHARDS} shard(s)")
+# The compact index is written beside Chroma's own files: more disk, less RAM when serving
+if COMPRESSION:
+    for store, path in zip(document_stores, store_paths):
+        compress_store(store, path, metric=MODEL_CONFIG.get("distance_function", "l2"), **COMPRESSION)
+publish_version(CHROMA_BASE_PATH, store_version)
+logger.info(f"Published store version {store_version}")
+
 end_time = time.time()
 elapsed_time = end_time - start_time
 logger.info(f"Ingestion completed in {elapsed_time:.2f} seconds.")
@@ -1,23 +1,64 @@
 import os
 import json
+import argparse
 import logging
 from datetime import datetime
 from pathlib import Path
-from haystack import Pipeline
+from haystack import Document, Pipeline
 from haystack_integrations.document_stores.chroma import ChromaDocumentStore
-from haystack.components.embedders import SentenceTransformersTextEmbedder
-from haystack_integrations.components.retrievers.chroma import ChromaEmbeddingRetriever
+from haystack.components.embedders import SentenceTransformersDocumentEmbedder, SentenceTransformersTextEmbedder
 from haystack_integrations.components.generators.google_genai import GoogleGenAIChatGenerator
 from haystack.dataclasses.chat_message import ChatMessage
+from map_api.store_versions import resolve_store_path
+from map_api.sharding import build_retriever, existing_shard_paths, search_batch
+from map_api.batch import ParseError, read_questions, run_batch
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = """
+You are a historical assistant that extracts structured information from research documents.
+
+Task:
+- From the provided context and question, extract the following:
+  1. Geographic locations (e.g., cities, regions, countries)
+  2. Time periods (e.g., centuries, dynasties)
+  3. Named rulers or polities (e.g., kings, empires)
+
+Response Format:
+Return only a JSON object like this:
+{
+  "locations": [{"name": "string", "description": "string"}],
+  "time_periods": [{"name": "string", "description": "string"}],
+  "rulers_or_polities": [{"name": "string", "description": "string"}]
+}
+
+Instructions:
+- Be concise and informative.
+- If an item isn't found, return an empty list for that field.
+- Do NOT include explanations, markdown, or extra text.
+"""
+
+
+CHROMA_SAVEPATH = "./data/chroma_db"
+EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+
+def build_messages(query, docs):
+    context = "\n\n".join(doc.content.strip()[:1000] for doc in docs)
+    return [
+        ChatMessage.from_system(SYSTEM_PROMPT),
+        ChatMessage.from_user(f"Context:\n{context}\n\nUser Query: {query}")
+    ]
+
+def load_retriever():
+    paths = existing_shard_paths(resolve_store_path(CHROMA_SAVEPATH))
+    return build_retriever([ChromaDocumentStore(persist_path=path) for path in paths], paths)
+
 def build_retrieval_pipeline():
-    doc_store = ChromaDocumentStore(persist_path="./data/chroma_db")
     pipe = Pipeline()
-    pipe.add_component("embedder", SentenceTransformersTextEmbedder(model="sentence-transformers/all-mpnet-base-v2"))
-    pipe.add_component("retriever", ChromaEmbeddingRetriever(document_store=doc_store))
+    pipe.add_component("embedder", SentenceTransformersTextEmbedder(model=EMBEDDING_MODEL))
+    pipe.add_component("retriever", load_retriever())
     pipe.connect("embedder.embedding", "retriever.query_embedding")
     pipe.warm_up()
     return pipe
@@ -27,7 +68,50 @@ def build_generation_pipeline():
     pipe.add_component("generator", GoogleGenAIChatGenerator(model="gemini-1.5-flash"))
     return pipe
 
+def parse_reply(reply):
+    try:
+        return json.loads(reply.strip().removeprefix("```json").removesuffix("```"))
+    except ValueError as e:
+        raise ParseError(f"Reply is not JSON: {e}", reply) from e
+
+def run_batch_mode(args):
+    # The document embedder encodes a whole batch of questions in one forward pass
+    embedder = SentenceTransformersDocumentEmbedder(model=EMBEDDING_MODEL, batch_size=args.batch_size, progress_bar=False)
+    embedder.warm_up()
+    retriever = load_retriever()
+    generator = GoogleGenAIChatGenerator(model="gemini-1.5-flash")
+
+    def retrieve_batch(questions):
+        embedded = embedder.run(documents=[Document(content=q) for q in questions])["documents"]
+        results = search_batch(retriever, [doc.embedding for doc in embedded], args.top_k)
+        return [[d for d in retrieved if (d.content or "").strip()] for retrieved in results]
+
+    def generate(question, docs):
+        if not docs:
+            return {"locations": [], "time_periods": [], "rulers_or_polities": []}
+        reply = generator.run(messages=build_messages(question, docs))["replies"][0].text
+        return parse_reply(reply)
+
+    output = args.output or Path("./data/output") / f"{Path(args.batch).stem}_extractions.jsonl"
+    run_batch(read_questions(args.batch), retrieve_batch, generate, output,
+              concurrency=args.concurrency, batch_size=args.batch_size, retries=args.retries)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Context-aware JSON extraction over the document store")
+    parser.add_argument("--batch", metavar="QUESTIONS_FILE", help="Answer every line of this file instead of prompting")
+    parser.add_argument("--output", help="JSONL results file; rerunning with the same file resumes (default: data/output/<questions>_extractions.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Generator calls in flight at once")
+    parser.add_argument("--batch-size", type=int, default=32, help="Questions embedded and retrieved per batch")
+    parser.add_argument("--retries", type=int, default=5, help="Retries per generator call, with exponential backoff")
+    parser.add_argument("--top-k", type=int, default=10)
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    if args.batch:
+        run_batch_mode(args)
+        return
+
     retrieval_pipeline = build_retrieval_pipeline()
     generation_pipeline = build_generation_pipeline()
 
@@ -50,33 +134,7 @@ def main():
                 print("⚠️ No documents with valid content retrieved. Skipping LLM call.")
                 continue
 
-            context = "\n\n".join(doc.content.strip()[:1000] for doc in valid_docs)
-
-            messages = [
-                ChatMessage.from_system("""
-You are a historical assistant that extracts structured information from research documents.
-
-Task:
-- From the provided context and question, extract the following:
-  1. Geographic locations (e.g., cities, regions, countries)
-  2. Time periods (e.g., centuries, dynasties)
-  3. Named rulers or polities (e.g., kings, empires)
-
-Response Format:
-Return only a JSON object like this:
-{
-  "locations": [{"name": "string", "description": "string"}],
-  "time_periods": [{"name": "string", "description": "string"}],
-  "rulers_or_polities": [{"name": "string", "description": "string"}]
-}
-
-Instructions:
-- Be concise and informative.
-- If an item isn't found, return an empty list for that field.
-- Do NOT include explanations, markdown, or extra text.
-"""),
-                ChatMessage.from_user(f"Context:\n{context}\n\nUser Query: {query}")
-            ]
+            messages = build_messages(query, valid_docs)
 
             generation_results = generation_pipeline.run({
                 "generator": {"messages": messages}
@@ -1,10 +1,14 @@
-from haystack import Pipeline
+from haystack import Document, Pipeline
 from haystack_integrations.document_stores.chroma import ChromaDocumentStore
-from haystack.components.embedders import SentenceTransformersTextEmbedder
-from haystack_integrations.components.retrievers.chroma import ChromaEmbeddingRetriever
+from haystack.components.embedders import SentenceTransformersDocumentEmbedder, SentenceTransformersTextEmbedder
 from haystack.components.builders import ChatPromptBuilder
 from haystack_integrations.components.generators.google_genai import GoogleGenAIChatGenerator
 from haystack.dataclasses.chat_message import ChatMessage, ChatRole
+from map_api.store_versions import resolve_store_path
+from map_api.sharding import build_retriever, existing_shard_paths, search_batch
+from map_api.batch import read_questions, run_batch
+from pathlib import Path
+import argparse
 import os
 import logging
 
@@ -12,13 +16,27 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 CHROMA_SAVEPATH = "./data/chroma_db_e5_embeddings"
+EMBEDDING_MODEL = "intfloat/e5-large-v2"
+
+PROMPT_TEMPLATE = [
+    ChatMessage.from_system("""
+You are a helpful assistant that provides factual, concise answers grounded in the provided documents.
+
+Documents:
+{% for doc in documents %}
+{{ doc.content }}
+{% endfor %}
+"""),
+    ChatMessage.from_user("{{query}}")
+]
 
 def setup_retrieval_pipeline():
     logger.info(f"Initializing ChromaDocumentStore from: {CHROMA_SAVEPATH}")
-    ds = ChromaDocumentStore(persist_path=CHROMA_SAVEPATH)
+    paths = existing_shard_paths(resolve_store_path(CHROMA_SAVEPATH))
+    stores = [ChromaDocumentStore(persist_path=path) for path in paths]
 
     try:
-        doc_count = ds.count_documents()
+        doc_count = sum(ds.count_documents() for ds in stores)
         logger.info(f"Found {doc_count} documents in the ChromaDocumentStore.")
         if doc_count == 0:
             logger.warning("Warning: No documents found in the store. Please run ingestion first or check the data path.")
@@ -27,19 +45,9 @@ def setup_retrieval_pipeline():
         return None
 
     retrieval_pipeline = Pipeline()
-    retrieval_pipeline.add_component("embedder", SentenceTransformersTextEmbedder(model="intfloat/e5-large-v2"))
-    retrieval_pipeline.add_component("retriever", ChromaEmbeddingRetriever(document_store=ds))
-    retrieval_pipeline.add_component("prompt", ChatPromptBuilder(template=[
-        ChatMessage.from_system("""
-You are a helpful assistant that provides factual, concise answers grounded in the provided documents.
-
-Documents:
-{% for doc in documents %}
-{{ doc.content }}
-{% endfor %}
-"""),
-        ChatMessage.from_user("{{query}}")
-    ], required_variables=["documents", "query"]))
+    retrieval_pipeline.add_component("embedder", SentenceTransformersTextEmbedder(model=EMBEDDING_MODEL))
+    retrieval_pipeline.add_component("retriever", build_retriever(stores, paths))
+    retrieval_pipeline.add_component("prompt", ChatPromptBuilder(template=PROMPT_TEMPLATE, required_variables=["documents", "query"]))
     retrieval_pipeline.add_component("generator", GoogleGenAIChatGenerator(model="gemini-1.5-flash"))
 
     retrieval_pipeline.connect("embedder.embedding", "retriever.query_embedding")
@@ -56,7 +64,43 @@ Documents:
 
     return retrieval_pipeline
 
+def run_batch_mode(args):
+    # The document embedder encodes a whole batch of questions in one forward pass
+    embedder = SentenceTransformersDocumentEmbedder(model=EMBEDDING_MODEL, batch_size=args.batch_size, progress_bar=False)
+    embedder.warm_up()
+    paths = existing_shard_paths(resolve_store_path(CHROMA_SAVEPATH))
+    retriever = build_retriever([ChromaDocumentStore(persist_path=path) for path in paths], paths)
+    prompt_builder = ChatPromptBuilder(template=PROMPT_TEMPLATE, required_variables=["documents", "query"])
+    generator = GoogleGenAIChatGenerator(model="gemini-1.5-flash")
+
+    def retrieve_batch(questions):
+        embedded = embedder.run(documents=[Document(content=q) for q in questions])["documents"]
+        return search_batch(retriever, [doc.embedding for doc in embedded], args.top_k)
+
+    def generate(question, docs):
+        messages = prompt_builder.run(documents=docs, query=question)["prompt"]
+        return {"answer": generator.run(messages=messages)["replies"][0].text}
+
+    output = args.output or Path("./data/output") / f"{Path(args.batch).stem}_answers_e5.jsonl"
+    run_batch(read_questions(args.batch), retrieve_batch, generate, output,
+              concurrency=args.concurrency, batch_size=args.batch_size, retries=args.retries)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Question answering over the e5 document store")
+    parser.add_argument("--batch", metavar="QUESTIONS_FILE", help="Answer every line of this file instead of prompting")
+    parser.add_argument("--output", help="JSONL results file; rerunning with the same file resumes (default: data/output/<questions>_answers_e5.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Generator calls in flight at once")
+    parser.add_argument("--batch-size", type=int, default=32, help="Questions embedded and retrieved per batch")
+    parser.add_argument("--retries", type=int, default=5, help="Retries per generator call, with exponential backoff")
+    parser.add_argument("--top-k", type=int, default=10)
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    if args.batch:
+        run_batch_mode(args)
+        return
+
     pipeline = setup_retrieval_pipeline()
     if pipeline is None:
         print("Pipeline setup failed.")
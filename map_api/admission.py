@@ -0,0 +1,126 @@
+from django.conf import settings
+
+from .metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+from contextlib import contextmanager, nullcontext
+import math
+import threading
+import time
+
+DEFAULT_ADMISSION = {
+    "enabled": True,
+    "deadline": 15.0,
+    "stages": {
+        "embedding": {"max_concurrent": 2, "max_queue": 16},
+        "generation": {"max_concurrent": 8, "max_queue": 32},
+    },
+}
+
+
+def get_admission_config():
+    return {**DEFAULT_ADMISSION, **getattr(settings, "RAG_ADMISSION", {})}
+
+
+class Overloaded(Exception):
+    def __init__(self, stage, reason, retry_after):
+        super().__init__(f"Server busy ({stage} {reason.replace('_', ' ')}), retry in {retry_after}s")
+        self.stage = stage
+        self.reason = reason
+        self.retry_after = retry_after
+        # A full queue is the client's cue to back off; a missed deadline means we are saturated
+        self.status = 429 if reason == "queue_full" else 503
+
+
+class StageLimiter:
+    """Bounded concurrency for one stage with a bounded FIFO wait queue.
+
+    Waiters are shed once their request deadline passes, or straight away
+    when the expected wait (from a moving average of service time) would
+    already overrun it.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.avg_service = 1.0
+        self._cond = threading.Condition()
+
+    def expected_wait(self, position):
+        return self.avg_service * position / self.max_concurrent
+
+    def retry_after(self):
+        return max(1, math.ceil(self.expected_wait(self.waiting + 1)))
+
+    def _reject(self, reason):
+        ADMISSION_REJECTED.inc(stage=self.name, reason=reason)
+        raise Overloaded(self.name, reason, self.retry_after())
+
+    def _publish(self):
+        ADMISSION_QUEUE_DEPTH.set(self.waiting, stage=self.name)
+        ADMISSION_IN_FLIGHT.set(self.active, stage=self.name)
+
+    def _enter(self, deadline):
+        with self._cond:
+            if self.active < self.max_concurrent and self.waiting == 0:
+                self.active += 1
+                self._publish()
+                return
+            if self.waiting >= self.max_queue:
+                self._reject("queue_full")
+            if time.monotonic() + self.expected_wait(self.waiting + 1) > deadline:
+                self._reject("deadline")
+
+            self.waiting += 1
+            self._publish()
+            try:
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        # Pass on any wake-up we consumed so the next waiter is not stranded
+                        self._cond.notify()
+                        self._reject("deadline")
+                    self._cond.wait(remaining)
+                self.active += 1
+            finally:
+                self.waiting -= 1
+                self._publish()
+
+    def _exit(self, elapsed):
+        with self._cond:
+            self.active -= 1
+            self.avg_service = 0.8 * self.avg_service + 0.2 * elapsed
+            self._publish()
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self, deadline):
+        queued = time.monotonic()
+        self._enter(deadline)
+        started = time.monotonic()
+        ADMISSION_WAIT_SECONDS.observe(started - queued, stage=self.name)
+        try:
+            yield started - queued
+        finally:
+            self._exit(time.monotonic() - started)
+
+
+_config = get_admission_config()
+limiters = {
+    name: StageLimiter(name, stage["max_concurrent"], stage["max_queue"])
+    for name, stage in _config["stages"].items()
+}
+
+
+def request_deadline():
+    return time.monotonic() + _config["deadline"]
+
+
+def admission_slot(stage, deadline):
+    """Hold a slot of ``stage`` for the duration of the block; raises Overloaded when shed."""
+    limiter = limiters.get(stage)
+    if not _config["enabled"] or limiter is None:
+        return nullcontext(0.0)
+    return limiter.slot(deadline)
@@ -0,0 +1,177 @@
+"""Resumable, concurrent batch runs for the CLI question pipelines.
+
+Results are appended to a JSONL file as each question completes, one record
+per line. Rerunning with the same output file skips every question that
+already has a successful record, so an interrupted run resumes where it
+stopped and failed questions, including replies that could not be parsed,
+are retried. No Django dependency, so the root-level scripts can use it.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ParseError(ValueError):
+    """Raised by ``generate`` when the model replied but the reply is unusable; recorded as ``parse_error``."""
+
+    def __init__(self, message, raw):
+        super().__init__(message)
+        self.raw = raw
+
+
+def read_questions(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+
+def question_id(question):
+    return hashlib.sha1(question.encode("utf-8")).hexdigest()[:16]
+
+
+def completed_ids(output_path):
+    done = set()
+    path = Path(output_path)
+    if not path.exists():
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by an interrupted write
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+class JsonlWriter:
+    """Thread-safe appender that flushes every record to disk as it is written."""
+
+    def __init__(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Start on a fresh line if the previous run died mid-write
+        needs_newline = False
+        if path.exists() and path.stat().st_size:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        self._file = open(path, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def with_retries(fn, retries=5, base_delay=1.0, max_delay=60.0):
+    """Call ``fn``, retrying failures with jittered exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except ParseError:
+            raise  # The call itself succeeded; a rerun of the batch retries it
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"Attempt {attempt + 1}/{retries + 1} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def document_summary(doc):
+    return {"id": doc.id, "score": doc.score, "file_path": doc.meta.get("file_path", "Unknown")}
+
+
+def run_batch(questions, retrieve_batch, generate, output_path, concurrency=4, batch_size=32, retries=5):
+    """Answer every question in ``questions`` that is not already in ``output_path``.
+
+    ``retrieve_batch(questions)`` returns one document list per question and
+    is called on ``batch_size`` questions at a time. ``generate(question, docs)``
+    returns a JSON-serialisable result, or raises ``ParseError``, and runs on
+    up to ``concurrency`` threads. Retrieval stays at most one batch ahead of
+    generation.
+    """
+    done = completed_ids(output_path)
+    pending = [question for question in questions if question_id(question) not in done]
+    logger.info(f"{len(questions)} questions: {len(questions) - len(pending)} already done, {len(pending)} to run")
+
+    writer = JsonlWriter(output_path)
+    counts = {"ok": 0, "parse_error": 0, "error": 0}
+    counts_lock = threading.Lock()
+    started = time.perf_counter()
+
+    def work(question, docs):
+        record = {"id": question_id(question), "question": question,
+                  "documents": [document_summary(doc) for doc in docs]}
+        call_started = time.perf_counter()
+        try:
+            record["result"] = with_retries(lambda: generate(question, docs), retries)
+            record["status"] = "ok"
+        except ParseError as e:
+            logger.warning(f"Unparseable reply for: {question} — {e}")
+            record["status"] = "parse_error"
+            record["error"] = str(e)
+            record["raw"] = e.raw
+        except Exception as e:
+            logger.error(f"Generation failed for: {question} — {e}")
+            record["status"] = "error"
+            record["error"] = str(e)
+        record["seconds"] = round(time.perf_counter() - call_started, 3)
+        writer.write(record)
+        with counts_lock:
+            counts[record["status"]] += 1
+            finished = sum(counts.values())
+        logger.info(f"[{finished}/{len(pending)}] {record['status']}: {question[:80]}")
+
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-generate")
+    in_flight = set()
+    try:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            try:
+                results = retrieve_batch(batch)
+            except Exception as e:
+                logger.error(f"Retrieval failed for questions {start + 1}-{start + len(batch)}: {e}", exc_info=True)
+                for question in batch:
+                    writer.write({"id": question_id(question), "question": question,
+                                  "status": "error", "error": f"retrieval: {e}"})
+                with counts_lock:
+                    counts["error"] += len(batch)
+                continue
+
+            for question, docs in zip(batch, results):
+                in_flight.add(pool.submit(work, question, docs))
+            while len(in_flight) > batch_size:
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        wait(in_flight)
+    except KeyboardInterrupt:
+        logger.warning(f"Interrupted; rerun with the same output file ({output_path}) to resume")
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    finally:
+        pool.shutdown(wait=True)
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Batch finished in {elapsed:.1f}s: {counts['ok']} ok, {counts['parse_error']} unparseable, "
+        f"{counts['error']} failed ({len(done)} skipped from earlier runs)"
+    )
+    return {**counts, "skipped": len(done), "seconds": elapsed}
@@ -0,0 +1,138 @@
+from haystack import Document, component
+
+from typing import List
+import re
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+def length_report(lengths):
+    if not lengths:
+        return {"chunks": 0}
+    ordered = sorted(lengths)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    return {
+        "chunks": len(ordered),
+        "min": ordered[0],
+        "p10": pct(10),
+        "p50": pct(50),
+        "p90": pct(90),
+        "max": ordered[-1],
+        "mean": round(sum(ordered) / len(ordered), 1),
+    }
+
+
+@component
+class TokenAwareSplitter:
+    """Packs whole sentences into chunks of up to ``chunk_tokens`` model tokens.
+
+    Token counts come from the embedding model's own tokenizer, so chunks fill
+    the model's sequence window instead of being silently truncated (long
+    sentences) or left mostly empty (short ones). Consecutive chunks share
+    trailing sentences worth up to ``overlap_tokens``. A single sentence longer
+    than the window is cut on token boundaries.
+    """
+
+    def __init__(self, model: str, chunk_tokens: int = 256, overlap_tokens: int = 0):
+        self.model = model
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.chunk_lengths = []
+        self._tokenizer = None
+
+    def warm_up(self):
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model)
+        # Leave room for the [CLS]/[SEP] style special tokens the embedder adds
+        limit = self._tokenizer.model_max_length - self._tokenizer.num_special_tokens_to_add()
+        self.chunk_tokens = min(self.chunk_tokens, limit)
+        self.overlap_tokens = min(self.overlap_tokens, self.chunk_tokens // 2)
+
+    def _split_long_sentence(self, sentence):
+        encoding = self._tokenizer(sentence, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = encoding["offset_mapping"]
+        step = self.chunk_tokens - self.overlap_tokens
+        pieces = []
+        for start in range(0, len(offsets), step):
+            window = offsets[start:start + self.chunk_tokens]
+            pieces.append((sentence[window[0][0]:window[-1][1]], len(window)))
+            if start + self.chunk_tokens >= len(offsets):
+                break
+        return pieces
+
+    def _split_text(self, text):
+        sentences = [s.strip() for s in SENTENCE_SPLIT.split(text) if s.strip()]
+        if not sentences:
+            return []
+        counts = [len(ids) for ids in self._tokenizer(sentences, add_special_tokens=False)["input_ids"]]
+
+        chunks, current, current_tokens = [], [], 0
+
+        def flush():
+            if current:
+                chunks.append((" ".join(s for s, _ in current), current_tokens))
+
+        for sentence, count in zip(sentences, counts):
+            if count > self.chunk_tokens:
+                flush()
+                chunks.extend(self._split_long_sentence(sentence))
+                current, current_tokens = [], 0
+                continue
+
+            if current and current_tokens + count > self.chunk_tokens:
+                flush()
+                # Carry trailing sentences into the next chunk as token overlap
+                carried, carried_tokens = [], 0
+                for prev, prev_count in reversed(current):
+                    if carried_tokens + prev_count > self.overlap_tokens or carried_tokens + prev_count + count > self.chunk_tokens:
+                        break
+                    carried.insert(0, (prev, prev_count))
+                    carried_tokens += prev_count
+                current, current_tokens = carried, carried_tokens
+
+            current.append((sentence, count))
+            current_tokens += count
+
+        flush()
+        return chunks
+
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document]):
+        if self._tokenizer is None:
+            self.warm_up()
+
+        split_docs = []
+        for doc in documents:
+            if not doc.content:
+                continue
+            for split_id, (text, tokens) in enumerate(self._split_text(doc.content)):
+                meta = {**(doc.meta or {}), "source_id": doc.id, "split_id": split_id, "token_count": tokens}
+                split_docs.append(Document(content=text, meta=meta))
+                self.chunk_lengths.append(tokens)
+        return {"documents": split_docs}
+
+    def report(self):
+        return length_report(self.chunk_lengths)
+
+
+def build_splitter(model_config, split_by="tokens"):
+    """Splitter for an entry of ``settings.EMBEDDING_MODELS``."""
+    if split_by == "tokens":
+        return TokenAwareSplitter(
+            model=model_config["name"],
+            chunk_tokens=model_config.get("chunk_tokens", 256),
+            overlap_tokens=model_config.get("chunk_overlap_tokens", 0),
+        )
+
+    from haystack.components.preprocessors import DocumentSplitter
+
+    return DocumentSplitter(
+        split_by=split_by,
+        split_length=model_config.get("split_length", 10),
+        split_overlap=model_config.get("split_overlap", 0),
+    )
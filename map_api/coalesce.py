@@ -0,0 +1,207 @@
+from django.conf import settings
+
+from .admission import Overloaded
+
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; cross-process coalescing is disabled there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COALESCING = {
+    "enabled": True,
+    "cross_process": False,
+    "lock_dir": "./data/run/singleflight",
+    "result_ttl": 5.0,
+    "poll_interval": 0.05,  # How often a worker waiting on another worker's lock retries it
+    "prune_interval": 60.0,  # Seconds between sweeps of stale lock and result files
+}
+
+
+def get_coalescing_config():
+    return {**DEFAULT_COALESCING, **getattr(settings, "RAG_COALESCING", {})}
+
+
+def coalescing_key(query, embedding, history_state, options=None):
+    normalized = " ".join(query.lower().split())
+    raw = json.dumps([normalized, embedding, history_state, options], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent callers with the same key.
+
+    Threads in this process wait on the leader's call. With ``cross_process``
+    enabled, the leader also takes an flock on a per-key lock file so that
+    other workers wait for it and reuse its result file instead of computing
+    the same answer again. A result file is only reused by workers that were
+    already waiting when it was written, so it never answers a later request.
+    Followers give up with ``Overloaded`` once their request deadline passes.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_coalescing_config()
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._last_prune = 0.0
+
+    def do(self, key, fn, deadline=None):
+        """Return ``(value, shared)``; ``shared`` is True when another caller computed it.
+
+        ``deadline`` is a ``time.monotonic()`` value that bounds how long a
+        follower waits for the leader.
+        """
+        if not self.config["enabled"]:
+            return fn(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(self._remaining(deadline)):
+                raise self._timed_out()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        shared = False
+        try:
+            if self.config["cross_process"] and fcntl is not None:
+                call.value, shared = self._do_across_processes(key, fn, deadline)
+            else:
+                call.value = fn()
+            return call.value, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    @staticmethod
+    def _remaining(deadline):
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    @staticmethod
+    def _timed_out():
+        return Overloaded("coalesce", "deadline", 1)
+
+    def _lock_until(self, lock_file, deadline):
+        if deadline is None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._timed_out()
+                time.sleep(min(self.config["poll_interval"], remaining))
+
+    def _open_locked(self, path, deadline):
+        while True:
+            lock_file = open(path, "a")
+            try:
+                self._lock_until(lock_file, deadline)
+                # _prune may have unlinked the file before we got the lock; only the one at path counts
+                if os.path.samestat(os.fstat(lock_file.fileno()), os.stat(path)):
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                lock_file.close()
+                raise
+            lock_file.close()
+
+    def _do_across_processes(self, key, fn, deadline):
+        lock_dir = Path(self.config["lock_dir"])
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        result_path = lock_dir / f"{key}.json"
+
+        waiting_since = time.time()
+        with self._open_locked(lock_dir / f"{key}.lock", deadline) as lock_file:
+            try:
+                cached = self._read_result(result_path, waiting_since)
+                if cached is not None:
+                    return cached["value"], True
+
+                # Whatever is left is from a computation this caller did not wait for
+                result_path.unlink(missing_ok=True)
+                value = fn()
+                tmp_path = result_path.with_suffix(f".{os.getpid()}.tmp")
+                tmp_path.write_text(json.dumps({"finished": time.time(), "value": value}), encoding="utf-8")
+                os.replace(tmp_path, result_path)
+                return value, False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._maybe_prune(lock_dir)
+
+    def _read_result(self, path, waiting_since):
+        """The result written while this caller waited for the lock, if any."""
+        try:
+            result = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        finished = result.get("finished", 0)
+        if finished < waiting_since or time.time() - finished > self.config["result_ttl"]:
+            return None
+        return result
+
+    def _maybe_prune(self, lock_dir):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_prune < self.config["prune_interval"]:
+                return
+            self._last_prune = now
+        self._prune(lock_dir)
+
+    def _prune(self, lock_dir):
+        # Result files only matter for result_ttl seconds; lock files are kept a while longer
+        now = time.time()
+        for path in lock_dir.iterdir():
+            max_age = self.config["result_ttl"] if path.suffix == ".json" else 3600
+            try:
+                if now - path.stat().st_mtime <= max_age:
+                    continue
+                if path.suffix == ".lock":
+                    self._prune_lock(path)
+                else:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def _prune_lock(self, path):
+        # Holding a lock does not touch its file, so an old one may still be in use: unlink
+        # it only while we hold it ourselves (see _open_locked for callers that opened it first)
+        with open(path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            if os.path.samestat(os.fstat(lock_file.fileno()), os.stat(path)):
+                path.unlink()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,98 @@
+from django.conf import settings
+
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 3000
+CHARS_PER_TOKEN = 4  # Rough estimate for English prose; Gemini has no local tokenizer
+MIN_TAIL_TOKENS = 64
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def get_token_budget(model):
+    budgets = getattr(settings, "CONTEXT_TOKEN_BUDGETS", {})
+    return budgets.get(model, budgets.get("default", DEFAULT_TOKEN_BUDGET))
+
+
+def _normalize(sentence):
+    return " ".join(re.findall(r"\w+", sentence.lower()))
+
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def pack_context(docs, budget):
+    """Pack document texts in rank order into at most ``budget`` tokens.
+
+    Sentences already included from a higher-ranked chunk (the splitter
+    overlap between neighbouring chunks) are dropped, and passages that are
+    near-duplicates of an included one are skipped entirely. Returns the
+    passages and the documents they came from.
+    """
+    seen_sentences = set()
+    packed_shingles = []
+    passages, used_docs = [], []
+    remaining = budget
+
+    for doc in docs:
+        sentences = [s for s in SENTENCE_SPLIT.split(doc.content.strip()) if s.strip()]
+        fresh = [s for s in sentences if _normalize(s) not in seen_sentences]
+        if not fresh:
+            continue
+
+        text = " ".join(fresh)
+        shingles = _shingles(text)
+        if any(_jaccard(shingles, other) >= NEAR_DUPLICATE_THRESHOLD for other in packed_shingles):
+            continue
+
+        if estimate_tokens(text) > remaining:
+            if remaining < MIN_TAIL_TOKENS:
+                break
+            # Fill the rest of the budget with whole sentences, or a hard cut for one long sentence
+            kept = []
+            for sentence in fresh:
+                if estimate_tokens(" ".join(kept + [sentence])) > remaining:
+                    break
+                kept.append(sentence)
+            fresh = kept or [text[:remaining * CHARS_PER_TOKEN]]
+            text = " ".join(fresh)
+
+        passages.append(text)
+        used_docs.append(doc)
+        packed_shingles.append(shingles)
+        seen_sentences.update(_normalize(s) for s in fresh)
+        remaining -= estimate_tokens(text)
+        if remaining <= 0:
+            break
+
+    return passages, used_docs
+
+
+def build_context(docs, model):
+    passages, _ = pack_context(docs, get_token_budget(model))
+    context = "\n---\n".join(passages)
+
+    # The previous prompt carried every chunk's first 1000 characters twice
+    naive_tokens = 2 * sum(estimate_tokens(doc.content[:1000]) for doc in docs)
+    packed_tokens = estimate_tokens(context)
+    logger.info(
+        f"Context packing: {len(passages)}/{len(docs)} passages, ~{packed_tokens} tokens "
+        f"(saved ~{naive_tokens - packed_tokens} tokens)"
+    )
+    return context
@@ -0,0 +1,204 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from .models import ChatMessageHistory
+from .retention import record_turn
+from .metrics import CACHE_HITS, CACHE_MISSES
+
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+MAX_TURNS = getattr(settings, "CONVERSATION_MAX_TURNS", 3)
+MAX_SESSIONS = getattr(settings, "CONVERSATION_MAX_SESSIONS", 1000)
+GUEST_USERNAME = "guest"
+
+# Cache shared by all workers; a buffer whose version differs from the cached one is stale
+VERSION_CACHE = getattr(settings, "CONVERSATION_CACHE", "default")
+
+# A single writer keeps history inserts ordered and avoids SQLite write contention
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-history-writer")
+
+_states = OrderedDict()
+_states_lock = threading.Lock()
+_guest = None
+
+
+class ConversationState:
+    """Recent turns of one conversation, kept in memory and written through to the DB.
+
+    Once a change is in the DB the writer publishes a new version to the shared
+    cache, so a worker whose buffer was left behind by another worker notices
+    on the next request and reloads the turns from the DB.
+    """
+
+    def __init__(self, key, user, turns=(), session_key="", version=None):
+        self.key = key
+        self.user = user
+        self.session_key = session_key
+        self.turns = deque(turns, maxlen=MAX_TURNS)
+        self.version = version
+        self.lock = threading.Lock()
+        self._summary = None
+        self._keywords = None
+
+    @property
+    def summary(self):
+        if self._summary is None:
+            self._summary = "\n".join([
+                f"Q: {pair['user']}\nA: {pair.get('assistant', '')}" for pair in self.turns
+            ])
+        return self._summary
+
+    @property
+    def recent_questions(self):
+        return [pair["user"] for pair in self.turns]
+
+    def keywords(self, extractor):
+        if self._keywords is None:
+            questions = self.recent_questions
+            self._keywords = extractor(questions) if questions else []
+        return self._keywords
+
+    def display(self):
+        chat_display = []
+        for pair in self.turns:
+            chat_display.append({"role": "user", "content": pair["user"]})
+            if "assistant" in pair:
+                chat_display.append({"role": "assistant", "content": pair["assistant"]})
+        return chat_display
+
+    def _changed(self):
+        self._summary = None
+        self._keywords = None
+
+    def _publish(self):
+        version = uuid.uuid4().hex
+        caches[VERSION_CACHE].set(_version_key(self.key), version)
+        with self.lock:
+            self.version = version
+
+    def append(self, query, answer, embedding="e5", structured_data=None, retrieved_documents=None):
+        with self.lock:
+            self.turns.append({"user": query, "assistant": answer})
+            self._changed()
+
+        rows = [
+            ChatMessageHistory(
+                user=self.user, session_key=self.session_key, role="user", content=query, embedding=embedding
+            ),
+            ChatMessageHistory(
+                user=self.user,
+                session_key=self.session_key,
+                role="assistant",
+                content=answer,
+                embedding=embedding,
+                structured_data=structured_data,
+                retrieved_documents=retrieved_documents,
+            ),
+        ]
+        return _writer.submit(_persist_rows, self, rows)
+
+    def clear(self):
+        with self.lock:
+            self.turns.clear()
+            self._changed()
+        # Queue the delete behind any pending inserts so nothing reappears afterwards
+        return _writer.submit(_delete_rows, self)
+
+
+def _version_key(key):
+    return f"chat-version:{key}"
+
+
+def _persist_rows(state, rows):
+    close_old_connections()
+    try:
+        ChatMessageHistory.objects.bulk_create(rows)
+        state._publish()
+        record_turn(rows[0].user_id, rows[0].session_key)
+    except Exception:
+        logger.exception("Failed to persist chat turn")
+    finally:
+        close_old_connections()
+
+
+def _delete_rows(state):
+    close_old_connections()
+    try:
+        ChatMessageHistory.objects.filter(user=state.user, session_key=state.session_key).delete()
+        state._publish()
+    finally:
+        close_old_connections()
+
+
+def _guest_user():
+    global _guest
+    if _guest is None:
+        _guest, _ = User.objects.get_or_create(username=GUEST_USERNAME)
+    return _guest
+
+
+def _load_turns(user, session_key):
+    history_entries = (
+        # Summary rows from retention have no question of their own
+        ChatMessageHistory.objects.filter(user=user, session_key=session_key, compacted=False)
+        .order_by("-timestamp", "-id")[:MAX_TURNS * 2][::-1]
+    )
+    qa_pairs = []
+    for entry in history_entries:
+        if entry.role == "user":
+            qa_pairs.append({"user": entry.content})
+        elif entry.role == "assistant" and qa_pairs:
+            qa_pairs[-1]["assistant"] = entry.content
+    return qa_pairs[-MAX_TURNS:]
+
+
+def _state_key(request):
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    if not request.session.session_key:
+        request.session.create()
+    return f"session:{request.session.session_key}"
+
+
+def get_conversation(request):
+    """Return the conversation for the requesting user or anonymous session.
+
+    The worker's buffer is used while its version matches the one in the
+    shared cache; otherwise the turns are reloaded from the database. The
+    session only identifies anonymous clients and is never written to here.
+    Anonymous sessions are stored under one shared guest user, keyed by session.
+    """
+    key = _state_key(request)
+    version = caches[VERSION_CACHE].get(_version_key(key))
+    with _states_lock:
+        state = _states.get(key)
+        if state is not None and state.version == version:
+            _states.move_to_end(key)
+            CACHE_HITS.inc(cache="conversation")
+            return state
+
+    CACHE_MISSES.inc(cache="conversation")
+    if request.user.is_authenticated:
+        user, session_key = request.user, ""
+    else:
+        user, session_key = _guest_user(), request.session.session_key
+    state = ConversationState(key, user, _load_turns(user, session_key), session_key, version)
+
+    with _states_lock:
+        # Another thread may have loaded the same version meanwhile; keep the first
+        current = _states.get(key)
+        if current is not None and current.version == version:
+            state = current
+        _states[key] = state
+        _states.move_to_end(key)
+        while len(_states) > MAX_SESSIONS:
+            _states.popitem(last=False)
+    return state
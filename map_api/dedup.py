@@ -0,0 +1,145 @@
+from haystack import Document, component
+
+from pathlib import Path
+from typing import List, Optional
+import hashlib
+import json
+import logging
+import re
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HASH_PRIME = np.uint64(4294967291)  # Largest prime below 2**32
+
+
+def _shingle_hashes(text, size):
+    words = re.findall(r"\w+", text.lower())
+    shingles = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+
+
+def _choose_bands(num_perm, threshold):
+    """Pick bands x rows so the LSH collision threshold sits just below ``threshold``.
+
+    Candidates are verified against the estimated Jaccard afterwards, so
+    erring towards more candidates only costs comparisons, not precision.
+    """
+    options = []
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands == 0:
+            rows = num_perm // bands
+            options.append(((1 / bands) ** (1 / rows), bands, rows))
+    below = [option for option in options if option[0] <= threshold]
+    _, bands, rows = max(below) if below else min(options)
+    return bands, rows
+
+
+@component
+class NearDuplicateFilter:
+    """Folds near-duplicate chunks (reprints, overlapping editions) into one canonical chunk.
+
+    Chunks are compared by MinHash signatures over word shingles, with
+    LSH banding to find candidate pairs. The first chunk seen is kept; its
+    metadata records every source file as a "; "-joined ``source_file_paths``
+    string (Chroma metadata cannot hold lists) and the ``duplicate_count``.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        num_perm: int = 128,
+        shingle_size: int = 5,
+        seed: int = 1,
+        report_path: Optional[str] = None,
+    ):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.report_path = report_path
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(HASH_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(HASH_PRIME), size=num_perm, dtype=np.uint64)
+        self.last_report = None
+
+    def signature(self, text):
+        hashes = _shingle_hashes(text, self.shingle_size)
+        # a, b and the hashes are all below 2**32, so a * h + b cannot overflow uint64
+        return ((np.outer(hashes, self._a) + self._b) % HASH_PRIME).min(axis=0)
+
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document]):
+        buckets = {}
+        canonical, clusters = [], {}
+
+        for doc in documents:
+            if not doc.content:
+                continue
+            sig = self.signature(doc.content)
+            keys = [(band, sig[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+            match = None
+            for key in keys:
+                for index in buckets.get(key, ()):
+                    if np.mean(canonical[index][1] == sig) >= self.threshold:
+                        match = index
+                        break
+                if match is not None:
+                    break
+
+            if match is None:
+                index = len(canonical)
+                canonical.append((doc, sig))
+                clusters[index] = [doc]
+                for key in keys:
+                    buckets.setdefault(key, []).append(index)
+            else:
+                clusters[match].append(doc)
+
+        kept = []
+        for index, (doc, _) in enumerate(canonical):
+            members = clusters[index]
+            paths = list(dict.fromkeys(member.meta.get("file_path", "Unknown") for member in members))
+            doc.meta["source_file_paths"] = "; ".join(paths)
+            doc.meta["duplicate_count"] = len(members) - 1
+            kept.append(doc)
+
+        total = sum(len(members) for members in clusters.values())
+        self.last_report = self._report(total, canonical, clusters)
+        logger.info(
+            f"Dedup: {self.last_report['input_chunks']} -> {self.last_report['output_chunks']} chunks "
+            f"({self.last_report['removed']} near-duplicates, threshold {self.threshold}, "
+            f"{self.bands} bands x {self.rows} rows)"
+        )
+        if self.report_path:
+            path = Path(self.report_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(self.last_report, indent=2, ensure_ascii=False), encoding="utf-8")
+        return {"documents": kept}
+
+    def _report(self, total, canonical, clusters):
+        folded = [
+            {
+                "canonical_id": canonical[index][0].id,
+                "file_paths": canonical[index][0].meta["source_file_paths"].split("; "),
+                "duplicates": len(members) - 1,
+                "snippet": canonical[index][0].content[:120],
+            }
+            for index, members in clusters.items()
+            if len(members) > 1
+        ]
+        folded.sort(key=lambda cluster: cluster["duplicates"], reverse=True)
+        output = len(canonical)
+        return {
+            "input_chunks": total,
+            "output_chunks": output,
+            "removed": total - output,
+            "threshold": self.threshold,
+            "clusters": folded,
+        }
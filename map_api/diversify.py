@@ -0,0 +1,60 @@
+import numpy as np
+
+DEFAULT_MMR = {
+    "enabled": False,
+    "lambda": 0.7,
+    "k": 10,
+    "per_file_limit": 3,
+    "fetch_factor": 3,
+}
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def mmr_select(query_embedding, docs, k=10, lambda_mult=0.7, per_file_limit=None):
+    """Pick up to ``k`` documents by maximal marginal relevance.
+
+    Each step takes the candidate maximising
+    ``lambda * sim(query, doc) - (1 - lambda) * max sim(doc, selected)``, using
+    cosine similarity over the embeddings the retriever returned. At most
+    ``per_file_limit`` documents are taken from one ``file_path``. Documents
+    without an embedding keep their retrieval order behind the scored ones.
+    """
+    scored = [doc for doc in docs if doc.embedding is not None]
+    unscored = [doc for doc in docs if doc.embedding is None]
+    file_counts = {}
+    selected = []
+
+    def take(doc):
+        path = doc.meta.get("file_path", "Unknown")
+        if per_file_limit and file_counts.get(path, 0) >= per_file_limit:
+            return False
+        file_counts[path] = file_counts.get(path, 0) + 1
+        selected.append(doc)
+        return True
+
+    if scored:
+        embeddings = _normalize(np.asarray([doc.embedding for doc in scored], dtype=np.float32))
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        relevance = embeddings @ query
+        similarity = embeddings @ embeddings.T
+
+        max_similarity = np.full(len(scored), -np.inf, dtype=np.float32)
+        available = np.ones(len(scored), dtype=bool)
+        while len(selected) < k and available.any():
+            redundancy = np.where(np.isinf(max_similarity), 0.0, max_similarity)
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+            scores[~available] = -np.inf
+            best = int(np.argmax(scores))
+            available[best] = False
+            if take(scored[best]):
+                max_similarity = np.maximum(max_similarity, similarity[best])
+
+    for doc in unscored:
+        if len(selected) >= k:
+            break
+        take(doc)
+    return selected
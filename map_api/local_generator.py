@@ -0,0 +1,67 @@
+from haystack import component
+from haystack.dataclasses.chat_message import ChatMessage, ChatRole
+
+from typing import Any, Dict, List, Optional
+import math
+import random
+import time
+
+DEFAULT_REPLY = """Answer: {query} The documents describe the founding of Rome by Romulus in 753 BC and its growth under the early kings.
+
+Locations:
+- Rome: City on the Tiber, traditionally founded in 753 BC.
+- Latium: Region of central Italy around early Rome.
+
+Time Periods:
+- 8th century BC: The era traditionally associated with the founding of Rome.
+
+Rulers or Polities:
+- Romulus: First King of Rome, according to legend.
+- Roman Kingdom: Monarchy that ruled Rome before the Republic."""
+
+
+@component
+class LocalChatGenerator:
+    """Drop-in stand-in for GoogleGenAIChatGenerator for load tests.
+
+    Replies with canned labelled-section text after a simulated delay: a
+    log-normal time to first token plus the reply length at a fixed token
+    rate. The rest of the RAG path runs unchanged.
+    """
+
+    def __init__(
+        self,
+        model: str = "local",
+        latency_median: float = 0.8,
+        latency_sigma: float = 0.35,
+        tokens_per_second: float = 80.0,
+        reply: str = DEFAULT_REPLY,
+        seed: Optional[int] = None,
+    ):
+        self.model = model
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.reply = reply
+        self._random = random.Random(seed)
+
+    def warm_up(self):
+        pass
+
+    def _delay(self, text):
+        first_token = 0.0
+        if self.latency_median > 0:
+            first_token = self._random.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+        streaming = len(text.split()) / self.tokens_per_second if self.tokens_per_second else 0.0
+        return first_token + streaming
+
+    @component.output_types(replies=List[ChatMessage])
+    def run(self, messages: List[ChatMessage], generation_kwargs: Optional[Dict[str, Any]] = None):
+        user_messages = [message.text for message in messages if message.is_from(ChatRole.USER)]
+        query = user_messages[-1] if user_messages else ""
+        if query.startswith("User Query:"):
+            query = query[len("User Query:"):].strip()
+
+        text = self.reply.replace("{query}", query)
+        time.sleep(self._delay(text))
+        return {"replies": [ChatMessage.from_assistant(text)]}
@@ -0,0 +1,201 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from map_api.quantization import (
+    COMPACT_DIR, DEFAULT_RESCORE_FACTOR, METHODS, CompactIndex, exact_distances, load_vectors
+)
+from map_api.sharding import existing_shard_paths
+from map_api.store_versions import current_version, resolve_store_path
+
+from haystack_integrations.components.retrievers.chroma import ChromaEmbeddingRetriever
+from haystack_integrations.document_stores.chroma import ChromaDocumentStore
+from haystack.components.embedders import SentenceTransformersTextEmbedder
+
+from datetime import datetime
+from pathlib import Path
+import json
+import os
+import resource
+import time
+
+import numpy as np
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current RSS, but still shows growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _disk_bytes(path, only=None, skip=None):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        rel = Path(root).relative_to(path).parts
+        if skip and skip in rel or only and only not in rel:
+            continue
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def _merge(results, top_k):
+    return {doc_id for doc_id, _ in sorted((hit for hits in results for hit in hits), key=lambda hit: hit[1])[:top_k]}
+
+
+class Command(BaseCommand):
+    help = (
+        "Build compact first-pass indexes (float16, int8 or PCA) for the published vector stores and report "
+        "the disk they add and the resident memory they save against recall versus exact search. Indexes are written into the current "
+        "store version in place; workers pick them up on their next store check. The first pass is a "
+        "brute-force scan over the codes that replaces Chroma's HNSW search; candidates are rescored with "
+        "the vectors Chroma stores."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("embeddings", nargs="*", help="Models from EMBEDDING_MODELS (default: all)")
+        parser.add_argument("--method", choices=METHODS, default="int8")
+        parser.add_argument("--dims", type=int, help="Target dimensions for --method pca (default: a quarter)")
+        parser.add_argument("--rescore-factor", type=int, default=DEFAULT_RESCORE_FACTOR,
+                            help="Candidates rescored at full precision, as a multiple of top-k")
+        parser.add_argument("--queries", help="Question file to measure recall with (default: sampled chunk vectors)")
+        parser.add_argument("--sample", type=int, default=200, help="Queries used to measure recall")
+        parser.add_argument("--top-k", type=int, default=10)
+        parser.add_argument("--dry-run", action="store_true", help="Only build in memory and report")
+
+    def handle(self, *args, **options):
+        names = options["embeddings"] or sorted(settings.EMBEDDING_MODELS)
+        unknown = [name for name in names if name not in settings.EMBEDDING_MODELS]
+        if unknown:
+            raise CommandError(f"Unknown embedding(s): {', '.join(unknown)}")
+
+        report = {name: self.compress_model(name, options) for name in names}
+
+        out_path = Path("./data/output") / f"vector_compression_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+        self.stdout.write(f"\n{'model':<8} {'method':<8} {'vectors':>8} {'store MiB':>10} {'disk added':>11} {'RSS MiB':>17} "
+                          f"{'recall 1st':>11} {'recall rescored':>16}")
+        for name, row in report.items():
+            self.stdout.write(
+                f"{name:<8} {row['method']:<8} {row['vectors']:>8} "
+                f"{row['disk_store_mib']:>10.1f} {'+' + format(row['disk_added_mib'], '.1f'):>11} "
+                f"{row['hnsw_rss_mib']:>7.1f} -> {row['compact_rss_mib']:>6.1f} "
+                f"{row['recall_first_pass']:>11.3f} {row['recall_rescored']:>16.3f}"
+            )
+        self.stdout.write(
+            "\nDisk: the compact index is written beside Chroma's float32 vectors and HNSW files, which are "
+            "kept, so the store grows by 'disk added'. RSS: growth from loading Chroma's HNSW index for one "
+            "query vs. loading the compact index, which is what the compact index saves."
+        )
+        self.stdout.write(f"Report written to {out_path}")
+
+    def compress_model(self, name, options):
+        config = settings.EMBEDDING_MODELS[name]
+        metric = config.get("distance_function", "l2")
+        store_path = resolve_store_path(config["path"])
+        paths = existing_shard_paths(store_path)
+        disk_store = sum(_disk_bytes(path, skip=COMPACT_DIR) for path in paths)
+
+        shards = []
+        for path in paths:
+            store = ChromaDocumentStore(persist_path=path, distance_function=metric)
+            ids, vectors = load_vectors(store)
+            if not ids:
+                raise CommandError(f"No embedded documents in {path}")
+            index = CompactIndex.build(ids, vectors, options["method"], metric, options["dims"], options["rescore_factor"])
+            if not options["dry_run"]:
+                index.save(path)
+            shards.append({"path": path, "store": store, "index": index, "ids": ids, "matrix": vectors,
+                           "vectors": dict(zip(ids, vectors))})
+
+        hnsw_rss, compact_rss = self.measure_rss(shards, options["dry_run"])
+        if options["dry_run"]:
+            disk_added = sum(shard["index"].memory_bytes() for shard in shards)
+        else:
+            disk_added = sum(_disk_bytes(path, only=COMPACT_DIR) for path in paths)
+        count = sum(len(shard["ids"]) for shard in shards)
+        dims = int(shards[0]["matrix"].shape[1])
+        row = {
+            "version": current_version(config["path"]),
+            "method": options["method"],
+            "metric": metric,
+            "vectors": count,
+            "dims": dims,
+            "compact_dims": int(shards[0]["index"].codes.shape[1]),
+            "shards": len(shards),
+            "float32_vectors_mib": count * dims * 4 / 2**20,
+            "compact_index_mib": sum(shard["index"].memory_bytes() for shard in shards) / 2**20,
+            "disk_store_mib": disk_store / 2**20,
+            "disk_added_mib": disk_added / 2**20,
+            "hnsw_rss_mib": hnsw_rss / 2**20,
+            "compact_rss_mib": compact_rss / 2**20,
+            **self.evaluate(config, shards, options),
+        }
+        if not options["dry_run"]:
+            self.stdout.write(f"{name}: wrote compact indexes into {store_path}")
+        return row
+
+    def measure_rss(self, shards, dry_run):
+        # Compact index first: once Chroma has loaded HNSW the process RSS no longer shows it cleanly
+        before = _rss_bytes()
+        if dry_run:
+            compact = sum(shard["index"].memory_bytes() for shard in shards)
+        else:
+            loaded = [CompactIndex.load(shard["path"]) for shard in shards]
+            compact = _rss_bytes() - before
+            del loaded
+
+        before = _rss_bytes()
+        for shard in shards:
+            query = shard["matrix"][0]
+            ChromaEmbeddingRetriever(document_store=shard["store"]).run(query_embedding=query.tolist(), top_k=1)
+        return _rss_bytes() - before, compact
+
+    def evaluate(self, config, shards, options):
+        top_k, sample = options["top_k"], options["sample"]
+        if options["queries"]:
+            with open(options["queries"], "r", encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()][:sample]
+            embedder = SentenceTransformersTextEmbedder(model=config["name"], progress_bar=False)
+            embedder.warm_up()
+            queries = [embedder.run(text=question)["embedding"] for question in questions]
+        else:
+            rng = np.random.default_rng(0)
+            pool = np.concatenate([shard["matrix"] for shard in shards])
+            queries = list(pool[rng.choice(len(pool), min(sample, len(pool)), replace=False)])
+
+        first_pass = rescored = 0.0
+        exact_seconds = compact_seconds = 0.0
+        for query in queries:
+            started = time.perf_counter()
+            exact = []
+            for shard in shards:
+                distances = exact_distances(query, shard["matrix"], shard["index"].metric)
+                exact.append([(shard["ids"][i], distances[i]) for i in np.argsort(distances)[:top_k]])
+            exact = _merge(exact, top_k)
+            exact_seconds += time.perf_counter() - started
+
+            approx = [[(doc_id, d) for doc_id, d, _ in shard["index"].search(query, top_k, rescore_factor=0)]
+                      for shard in shards]
+            first_pass += len(exact & _merge(approx, top_k)) / len(exact)
+
+            started = time.perf_counter()
+            hits = [[(doc_id, d) for doc_id, d, _ in shard["index"].search(
+                query, top_k, vector_source=lambda ids, vectors=shard["vectors"]: {i: vectors[i] for i in ids}
+            )] for shard in shards]
+            rescored += len(exact & _merge(hits, top_k)) / len(exact)
+            compact_seconds += time.perf_counter() - started
+
+        count = max(len(queries), 1)
+        return {
+            "queries": len(queries),
+            "top_k": top_k,
+            "rescore_factor": options["rescore_factor"],
+            "recall_first_pass": first_pass / count,
+            "recall_rescored": rescored / count,
+            "exact_ms": 1000 * exact_seconds / count,
+            "compact_ms": 1000 * compact_seconds / count,
+        }
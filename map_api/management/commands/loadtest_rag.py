@@ -0,0 +1,111 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from pathlib import Path
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_QUERIES = [
+    "Who founded the city of Rome?",
+    "Which kingdoms ruled Mesopotamia in the second millennium BC?",
+    "Where was the capital of the Achaemenid Empire?",
+    "When did the Etruscan cities decline?",
+    "Which rulers controlled Egypt during the New Kingdom?",
+]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the rag-query endpoint at stepped concurrency and report RPS, latency "
+        "percentiles and error rates. Run the server with GENERATOR_BACKEND = 'local' to avoid Gemini."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000/api/rag-query/")
+        parser.add_argument("--concurrency", default="1,2,4,8,16", help="Comma-separated concurrency steps.")
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds per step.")
+        parser.add_argument("--embedding", default="e5", choices=["e5", "mpnet"])
+        parser.add_argument("--queries-file", help="One query per line; defaults to a small built-in set.")
+        parser.add_argument("--timeout", type=float, default=120.0)
+
+    def handle(self, *args, **options):
+        queries = DEFAULT_QUERIES
+        if options["queries_file"]:
+            path = Path(options["queries_file"])
+            if not path.exists():
+                raise CommandError(f"Queries file not found: {path}")
+            # QuerySerializer only accepts 5-150 characters
+            queries = [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if 5 <= len(line.strip()) <= 150]
+            if not queries:
+                raise CommandError(f"No usable queries in {path}")
+
+        try:
+            steps = [int(step) for step in options["concurrency"].split(",") if step.strip()]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma-separated list of integers")
+
+        self.stdout.write(f"{'conc':>5} {'reqs':>6} {'rps':>7} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7} {'errors':>7}")
+        for concurrency in steps:
+            stats = self.run_step(concurrency, queries, options)
+            self.stdout.write(
+                f"{concurrency:>5} {stats['requests']:>6} {stats['rps']:>7.2f} "
+                f"{stats['p50']:>7.3f} {stats['p90']:>7.3f} {stats['p99']:>7.3f} {stats['max']:>7.3f} "
+                f"{stats['error_rate']:>6.1%}"
+            )
+            if stats["error_kinds"]:
+                self.stdout.write(f"      errors: {dict(stats['error_kinds'])}")
+
+    def run_step(self, concurrency, queries, options):
+        latencies, errors = [], []
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+
+        def virtual_user(worker_id):
+            # Each virtual user keeps its own session cookie, like a separate browser
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+            i = worker_id
+            while time.monotonic() < deadline:
+                body = json.dumps({"query": queries[i % len(queries)], "embedding": options["embedding"]}).encode("utf-8")
+                i += concurrency
+                request = urllib.request.Request(options["url"], data=body, headers={"Content-Type": "application/json"})
+                started = time.perf_counter()
+                try:
+                    with opener.open(request, timeout=options["timeout"]) as response:
+                        response.read()
+                    error = None
+                except (urllib.error.URLError, OSError) as e:
+                    error = getattr(e, "code", None) or type(e).__name__
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if error is not None:
+                        errors.append(error)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(virtual_user, range(concurrency)))
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            "requests": len(latencies),
+            "rps": len(latencies) / wall if wall else 0.0,
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else 0.0,
+            "error_rate": len(errors) / len(latencies) if latencies else 0.0,
+            "error_kinds": Counter(errors),
+        }
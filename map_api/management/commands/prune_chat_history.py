@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from map_api.retention import run_retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive and delete old ChatMessageHistory rows and replace old answers with per-conversation "
+        "summaries, according to CHAT_HISTORY_RETENTION."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-turns", type=int, dest="max_turns_per_user", help="Turns to keep per user or anonymous session.")
+        parser.add_argument("--max-age-days", type=int, help="Archive rows older than this many days.")
+        parser.add_argument("--compact-after-days", type=int, help="Summarize answers older than this many days.")
+        parser.add_argument("--archive-dir", help="Directory for the gzipped JSONL archives.")
+        parser.add_argument("--no-archive", action="store_true", help="Delete old rows without archiving them.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would change.")
+
+    def handle(self, *args, **options):
+        overrides = {
+            key: options[key]
+            for key in ("max_turns_per_user", "max_age_days", "compact_after_days", "archive_dir")
+        }
+        if options["no_archive"]:
+            overrides["archive_dir"] = ""
+
+        stats = run_retention(dry_run=options["dry_run"], **overrides)
+        for key, value in stats.items():
+            self.stdout.write(f"{key}: {value}")
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from map_api.sharding import ShardedDocumentWriter, existing_shard_paths, shard_paths
+from map_api.store_versions import new_version, publish_version, resolve_store_path
+
+from haystack_integrations.document_stores.chroma import ChromaDocumentStore
+
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Repartition the published vector store of a model into N shards. The stored embeddings "
+        "are copied into a new store version, so nothing is re-embedded and workers hot-swap to it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("embedding", choices=sorted(settings.EMBEDDING_MODELS))
+        parser.add_argument("--shards", type=int, help="Target shard count; defaults to the model's settings.")
+        parser.add_argument("--shard-key", choices=["file", "chunk"], help="Partition by source file or chunk id.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--no-publish", action="store_true", help="Build the new version without publishing it.")
+
+    def handle(self, *args, **options):
+        config = settings.EMBEDDING_MODELS[options["embedding"]]
+        shards = options["shards"] or config.get("shards", 1)
+        shard_key = options["shard_key"] or config.get("shard_key", "file")
+        distance_function = config.get("distance_function", "l2")
+        if shards < 1:
+            raise CommandError("--shards must be at least 1")
+
+        started = time.perf_counter()
+        source_paths = existing_shard_paths(resolve_store_path(config["path"]))
+        documents = []
+        for path in source_paths:
+            documents.extend(ChromaDocumentStore(persist_path=path, distance_function=distance_function).filter_documents())
+        if any(doc.embedding is None for doc in documents):
+            raise CommandError("The source store did not return embeddings; re-run ingestion instead.")
+        self.stdout.write(f"Read {len(documents)} chunks from {len(source_paths)} shard(s)")
+
+        version, path = new_version(config["path"])
+        stores = [
+            ChromaDocumentStore(persist_path=shard_path, distance_function=distance_function)
+            for shard_path in shard_paths(path, shards)
+        ]
+        writer = ShardedDocumentWriter(stores, shard_key=shard_key)
+        for start in range(0, len(documents), options["batch_size"]):
+            writer.run(documents[start:start + options["batch_size"]])
+
+        for shard_path, store in zip(shard_paths(path, shards), stores):
+            self.stdout.write(f"  {shard_path}: {store.count_documents()} chunks")
+
+        if options["no_publish"]:
+            self.stdout.write(f"Built version {version} (not published)")
+        else:
+            publish_version(config["path"], version)
+            self.stdout.write(f"Published version {version}")
+        self.stdout.write(f"Rebalanced into {shards} shard(s) in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from map_api.store_versions import current_version, list_versions, prune_versions, publish_version
+
+
+class Command(BaseCommand):
+    help = (
+        "List, publish (or roll back to) and prune versioned vector stores. "
+        "Running workers swap to a newly published version within VECTOR_STORE_RELOAD_INTERVAL seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("embedding", choices=sorted(settings.EMBEDDING_MODELS))
+        parser.add_argument("--publish", metavar="VERSION", help="Point CURRENT at this version.")
+        parser.add_argument("--prune", type=int, metavar="KEEP", help="Delete all but the newest KEEP versions.")
+
+    def handle(self, *args, **options):
+        base = settings.EMBEDDING_MODELS[options["embedding"]]["path"]
+
+        if options["publish"]:
+            try:
+                publish_version(base, options["publish"])
+            except FileNotFoundError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"Published {options['publish']}")
+
+        if options["prune"] is not None:
+            for version in prune_versions(base, options["prune"]):
+                self.stdout.write(f"Removed {version}")
+
+        current = current_version(base)
+        for version in list_versions(base):
+            marker = "*" if version == current else " "
+            self.stdout.write(f"{marker} {version}")
+        if current is None:
+            self.stdout.write(f"No published version; serving {base} directly")
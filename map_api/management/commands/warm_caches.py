@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from map_api.warmup import warm_caches
+
+import json
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the most frequent recent ChatMessageHistory queries and the data/input question files "
+        "through the embedders and retrievers, then report warm-up time and coverage. Caches live in "
+        "the process, so this mainly measures and pre-loads; set RAG_WARMUP['on_start'] to warm each worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--embedding", action="append", dest="embeddings",
+                            help="Model to warm (repeatable; default: all in EMBEDDING_MODELS)")
+        parser.add_argument("--history-days", type=int, help="Look back this many days of chat history.")
+        parser.add_argument("--max-history-queries", type=int, help="Most frequent history queries to replay.")
+        parser.add_argument("--question-dir", help="Directory of question .txt files (one question per line).")
+        parser.add_argument("--max-file-questions", type=int, help="Questions taken from the files.")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        unknown = [name for name in options["embeddings"] or [] if name not in settings.EMBEDDING_MODELS]
+        if unknown:
+            raise CommandError(f"Unknown embedding(s): {', '.join(unknown)}")
+
+        report = warm_caches(**{
+            key: options[key]
+            for key in ("embeddings", "history_days", "max_history_queries", "question_dir", "max_file_questions")
+        })
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for embedding, stats in report.items():
+            self.stdout.write(f"{embedding}:")
+            for key, value in stats.items():
+                self.stdout.write(f"  {key}: {value}")
@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+import threading
+import time
+
+# Metrics are kept per worker process; scrape every worker or aggregate downstream
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 16000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+REQUEST_SECONDS = register(Histogram("rag_request_seconds", "Total rag-query handling time."))
+STAGE_SECONDS = register(Histogram("rag_stage_seconds", "Time spent in each rag-query stage."))
+CACHE_HITS = register(Counter("rag_cache_hits_total", "Cache hits by cache name."))
+CACHE_MISSES = register(Counter("rag_cache_misses_total", "Cache misses by cache name."))
+DOCUMENTS_RETRIEVED = register(Histogram("rag_documents_retrieved", "Documents with content returned by retrieval.", COUNT_BUCKETS))
+PROMPT_TOKENS = register(Histogram("rag_prompt_tokens", "Estimated generation prompt size in tokens.", TOKEN_BUCKETS))
+SPECULATION_OUTCOMES = register(Counter("rag_speculative_retrieval_total", "Speculative raw-query retrievals by outcome."))
+ADMISSION_QUEUE_DEPTH = register(Gauge("rag_admission_queue_depth", "Requests waiting for a stage slot."))
+ADMISSION_IN_FLIGHT = register(Gauge("rag_admission_in_flight", "Requests holding a stage slot."))
+ADMISSION_WAIT_SECONDS = register(Histogram("rag_admission_wait_seconds", "Time spent waiting for a stage slot."))
+ADMISSION_REJECTED = register(Counter("rag_admission_rejected_total", "Requests shed by admission control."))
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Collects per-stage durations for one request.
+
+    Durations feed the Server-Timing header and the stage histograms, both
+    labelled with the request's embedding model. Speculative retrieval can
+    still record from a pool thread after the request has finished; those
+    late records are dropped.
+    """
+
+    def __init__(self, embedding="unknown"):
+        self.embedding = embedding
+        self.started = time.perf_counter()
+        self.durations = {}
+        self._finished = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, elapsed):
+        with self._lock:
+            if not self._finished:
+                self.durations[name] = self.durations.get(name, 0.0) + elapsed
+
+    def finish(self):
+        total = time.perf_counter() - self.started
+        with self._lock:
+            self._finished = True
+            self.durations["total"] = total
+            durations = dict(self.durations)
+        for name, elapsed in durations.items():
+            if name != "total":
+                STAGE_SECONDS.observe(elapsed, stage=name, embedding=self.embedding)
+        REQUEST_SECONDS.observe(total, embedding=self.embedding)
+
+    def server_timing(self):
+        with self._lock:
+            durations = list(self.durations.items())
+        return ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in durations)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map_api', '0003_chatmessagehistory_retrieved_documents_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessagehistory',
+            index=models.Index(fields=['user', 'timestamp'], name='chat_history_user_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map_api', '0004_chatmessagehistory_chat_history_user_ts_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessagehistory',
+            name='compacted',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map_api', '0005_chatmessagehistory_compacted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessagehistory',
+            name='session_key',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessagehistory',
+            index=models.Index(fields=['session_key', 'timestamp'], name='chat_history_session_ts_idx'),
+        ),
+    ]
@@ -9,6 +9,13 @@ class ChatMessageHistory(models.Model):
     embedding = models.CharField(max_length=50, default="e5")
     structured_data = models.JSONField(null=True, blank=True)
     retrieved_documents = models.JSONField(null=True, blank=True)
+    compacted = models.BooleanField(default=False)
+    # Anonymous sessions share the guest user; their rows are told apart by session
+    session_key = models.CharField(max_length=40, blank=True, default="")
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='chat_history_user_ts_idx'),
+            models.Index(fields=['session_key', 'timestamp'], name='chat_history_session_ts_idx'),
+        ]
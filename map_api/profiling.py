@@ -0,0 +1,171 @@
+from django.conf import settings
+
+from .request_threads import ThreadGroup
+
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILING = {
+    "header": "X-Profile-Request",
+    "sample_rate": 0.0,
+    "mode": "sampling",
+    "interval": 0.005,
+    "profile_dir": "./data/profiles",
+    "max_profiles": 200,
+}
+
+PROFILE_NAME = re.compile(r"^[\w-]+\.(folded|prof)$")
+
+# cProfile hooks the whole interpreter on Python 3.12+, so only one request at a time gets it
+_cprofile_lock = threading.Lock()
+
+
+def get_profiling_config():
+    return {**DEFAULT_PROFILING, **getattr(settings, "RAG_PROFILING", {})}
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread working on the request and writes collapsed stacks.
+
+    The calling thread and any pool threads running work submitted through
+    ``request_threads.follow`` are sampled; each stack is rooted at its
+    thread's name. The ``.folded`` output is the input format of
+    flamegraph.pl and is also read by speedscope.
+    """
+
+    extension = "folded"
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.threads = ThreadGroup()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.threads.join()
+        self._thread = threading.Thread(target=self._sample, name="rag-profiler", daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, name in self.threads.snapshot().items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    # Pool threads are reused, so strip the worker number to merge their stacks
+                    stack.append(re.sub(r"_\d+$", "", name))
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self, path):
+        self.threads.leave()
+        self._stop.set()
+        self._thread.join()
+        with open(path, "w", encoding="utf-8") as out:
+            for stack, count in self.stacks.most_common():
+                out.write(f"{stack} {count}\n")
+
+
+class CProfileRecorder:
+    """Deterministic cProfile trace of the calling thread; open the ``.prof`` file with snakeviz or flameprof.
+
+    Holds ``_cprofile_lock`` from ``start`` until ``stop``.
+    """
+
+    extension = "prof"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        try:
+            self.profile.enable()
+        except ValueError:
+            # Another profiler or debugger owns the interpreter's hooks
+            _cprofile_lock.release()
+            raise
+
+    def stop(self, path):
+        try:
+            self.profile.disable()
+        finally:
+            _cprofile_lock.release()
+        self.profile.dump_stats(path)
+
+
+class RequestProfile:
+    """Profiles one request; cProfile requests fall back to sampling while another request holds cProfile."""
+
+    def __init__(self, config):
+        self.config = config
+        self.recorder = None
+        if config["mode"] == "cprofile" and _cprofile_lock.acquire(blocking=False):
+            self.recorder = CProfileRecorder()
+
+    def start(self):
+        if self.recorder is not None:
+            try:
+                self.recorder.start()
+            except ValueError:
+                logger.warning("cProfile is unavailable; sampling this request instead")
+                self.recorder = None
+        if self.recorder is None:
+            self.recorder = SamplingProfiler(self.config["interval"])
+            self.recorder.start()
+        self.name = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.{self.recorder.extension}"
+        return self
+
+    def finish(self):
+        """Stop recording and save the profile; returns the file name, or None if saving failed."""
+        profile_dir = Path(self.config["profile_dir"])
+        try:
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            self.recorder.stop(profile_dir / self.name)
+            _prune(profile_dir, self.config["max_profiles"])
+        except OSError:
+            logger.exception("Failed to save request profile")
+            return None
+        logger.info(f"Saved request profile {self.name}")
+        return self.name
+
+
+def _prune(profile_dir, max_profiles):
+    profiles = sorted(profile_dir.iterdir(), key=lambda path: path.stat().st_mtime)
+    for path in profiles[:-max_profiles]:
+        path.unlink(missing_ok=True)
+
+
+def start_request_profile(request):
+    """Start profiling when a staff user asks for it or the request is sampled.
+
+    Returns None otherwise, so unprofiled requests only pay for this check.
+    """
+    config = get_profiling_config()
+    requested = request.headers.get(config["header"]) and request.user.is_staff
+    sampled = config["sample_rate"] > 0 and random.random() < config["sample_rate"]
+    if not (requested or sampled):
+        return None
+    return RequestProfile(config).start()
+
+
+def get_profile_path(name):
+    if not PROFILE_NAME.match(name):
+        return None
+    path = Path(get_profiling_config()["profile_dir"]) / name
+    return path if path.is_file() else None
@@ -0,0 +1,310 @@
+"""Compact first-pass vector indexes with full-precision rescoring.
+
+A store version (or each of its shards) can carry a ``compact/`` directory
+next to the Chroma files with the vectors in compact form (``codes.npy``),
+the codec parameters (``params.npz``) and the document ids (``index.json``):
+
+- ``float16`` halves each vector
+- ``int8`` scalar-quantizes every dimension to one byte
+- ``pca`` keeps the top ``dims`` principal components of the corpus, as float16
+
+The first pass is an exact brute-force scan over the codes in RAM (one
+matrix-vector product, since the dot product with a query is an affine
+function of the codes), not an ANN search. It replaces Chroma's HNSW index
+for unfiltered queries, so that index is never loaded. The
+``top_k * rescore_factor`` candidates are then rescored against the float32
+vectors Chroma already stores, fetched in one batched ``get``; no second
+full-precision copy is kept.
+
+Compact indexes trade disk for memory. Chroma only stores float32
+embeddings and always writes its HNSW files, and both are still needed (for
+rescoring, and for filtered queries), so the codes are an addition: the
+store grows on disk by the size of the compact index, and what is saved is
+the HNSW index in RAM. ``manage.py compress_vectors`` reports the disk added
+next to the memory saved.
+Like ``store_versions`` this module has no Django dependency.
+"""
+from haystack import Document, component
+from haystack_integrations.components.retrievers.chroma import ChromaEmbeddingRetriever
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+COMPACT_DIR = "compact"
+METHODS = ("float16", "int8", "pca")
+DEFAULT_RESCORE_FACTOR = 4
+PCA_FIT_SAMPLE = 20000
+BLOCK_ROWS = 65536
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def exact_distances(query_embedding, vectors, metric="l2"):
+    """Distances in Chroma's conventions: squared L2, or ``1 - similarity`` for cosine/ip."""
+    query = np.asarray(query_embedding, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if metric == "cosine":
+        return 1.0 - _normalize(vectors) @ _normalize(query)
+    if metric == "l2":
+        return np.einsum("ij,ij->i", vectors, vectors) - 2 * (vectors @ query) + float(query @ query)
+    return 1.0 - vectors @ query
+
+
+class CompactIndex:
+    def __init__(self, ids, codes, params, method, metric, rescore_factor=DEFAULT_RESCORE_FACTOR):
+        self.ids = ids
+        self.codes = codes
+        self.params = params
+        self.method = method
+        self.metric = metric
+        self.rescore_factor = rescore_factor
+
+    @classmethod
+    def build(cls, ids, embeddings, method, metric="l2", dims=None, rescore_factor=DEFAULT_RESCORE_FACTOR, seed=0):
+        if method not in METHODS:
+            raise ValueError(f"Unknown compression method {method!r}; expected one of {', '.join(METHODS)}")
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if metric == "cosine":
+            vectors = _normalize(vectors)
+        params = {"sq_norms": np.einsum("ij,ij->i", vectors, vectors)}
+
+        if method == "float16":
+            codes = vectors.astype(np.float16)
+        elif method == "int8":
+            low, high = vectors.min(axis=0), vectors.max(axis=0)
+            scale = (high - low) / 254
+            scale[scale == 0] = 1.0
+            params["offset"] = ((low + high) / 2).astype(np.float32)
+            params["scale"] = scale.astype(np.float32)
+            codes = np.clip(np.rint((vectors - params["offset"]) / params["scale"]), -127, 127).astype(np.int8)
+        else:
+            dims = min(dims or vectors.shape[1] // 4, *vectors.shape)
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(len(vectors), min(len(vectors), PCA_FIT_SAMPLE), replace=False)]
+            params["mean"] = sample.mean(axis=0)
+            _, _, vt = np.linalg.svd(sample - params["mean"], full_matrices=False)
+            params["components"] = vt[:dims].astype(np.float32)
+            codes = ((vectors - params["mean"]) @ params["components"].T).astype(np.float16)
+
+        return cls(list(ids), codes, params, method, metric, rescore_factor)
+
+    def _project(self, query):
+        """Weights ``w`` and constant ``c`` with ``codes @ w + c`` ~= ``vectors @ query``."""
+        if self.method == "float16":
+            return query, 0.0
+        if self.method == "int8":
+            return query * self.params["scale"], float(query @ self.params["offset"])
+        return self.params["components"] @ query, float(query @ self.params["mean"])
+
+    def first_pass(self, query_embedding, count):
+        """Brute-force scan of the codes; returns candidate rows and approximate distances, nearest first."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if self.metric == "cosine":
+            query = _normalize(query)
+        weights, constant = self._project(query)
+        dots = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), BLOCK_ROWS):
+            dots[start:start + BLOCK_ROWS] = self.codes[start:start + BLOCK_ROWS].astype(np.float32) @ weights
+        dots += constant
+        if self.metric == "l2":
+            distances = self.params["sq_norms"] - 2 * dots + float(query @ query)
+        else:
+            distances = 1.0 - dots
+        rows = _smallest(distances, count)
+        return rows, distances[rows]
+
+    def search(self, query_embedding, top_k=10, vector_source=None, rescore_factor=None):
+        """Return ``[(id, distance, vector)]`` for the ``top_k`` nearest documents.
+
+        ``vector_source(ids)`` returns ``{id: float32 vector}`` for the
+        candidates; they are rescored by exact distance. Without it (or with
+        ``rescore_factor=0``) the first-pass ranking is returned as is.
+        """
+        rescore_factor = self.rescore_factor if rescore_factor is None else rescore_factor
+        rows, approx = self.first_pass(query_embedding, top_k * max(rescore_factor, 1))
+        candidates = [self.ids[row] for row in rows]
+        if not rescore_factor or vector_source is None:
+            return [(doc_id, float(distance), None) for doc_id, distance in zip(candidates[:top_k], approx[:top_k])]
+        return self.rescore(query_embedding, candidates, vector_source(candidates), top_k)
+
+    def rescore(self, query_embedding, candidates, vectors, top_k):
+        """Rank ``candidates`` by exact distance using ``vectors`` (``{id: float32 vector}``)."""
+        found = [doc_id for doc_id in candidates if doc_id in vectors]
+        if not found:
+            return []
+        matrix = np.asarray([vectors[doc_id] for doc_id in found], dtype=np.float32)
+        exact = exact_distances(query_embedding, matrix, self.metric)
+        return [(found[i], float(exact[i]), matrix[i]) for i in np.argsort(exact)[:top_k]]
+
+    def memory_bytes(self):
+        return int(self.codes.nbytes + sum(array.nbytes for array in self.params.values()))
+
+    def save(self, store_path):
+        # Written beside the live index and swapped in, so a loading worker never sees half a directory
+        path = Path(store_path) / COMPACT_DIR
+        tmp = path.with_name(f"{COMPACT_DIR}.tmp-{os.getpid()}")
+        tmp.mkdir(parents=True, exist_ok=True)
+        np.save(tmp / "codes.npy", self.codes)
+        np.savez(tmp / "params.npz", **self.params)
+        (tmp / "index.json").write_text(json.dumps({
+            "method": self.method,
+            "metric": self.metric,
+            "rescore_factor": self.rescore_factor,
+            "dims": int(self.codes.shape[1]),
+            "ids": self.ids,
+        }), encoding="utf-8")
+        old = path.with_name(f"{COMPACT_DIR}.old-{os.getpid()}")
+        if path.exists():
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, store_path):
+        path = Path(store_path) / COMPACT_DIR
+        info = json.loads((path / "index.json").read_text(encoding="utf-8"))
+        with np.load(path / "params.npz") as params:
+            params = {name: params[name] for name in params.files}
+        return cls(
+            info["ids"],
+            np.load(path / "codes.npy"),
+            params,
+            info["method"],
+            info["metric"],
+            info.get("rescore_factor", DEFAULT_RESCORE_FACTOR),
+        )
+
+
+def _smallest(values, k):
+    if k >= len(values):
+        return np.argsort(values)
+    candidates = np.argpartition(values, k - 1)[:k]
+    return candidates[np.argsort(values[candidates])]
+
+
+def has_compact_index(store_path):
+    return (Path(store_path) / COMPACT_DIR / "index.json").is_file()
+
+
+def compact_signature(store_path):
+    """Changes whenever the compact index of ``store_path`` is (re)built or removed."""
+    try:
+        return (Path(store_path) / COMPACT_DIR / "index.json").stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def chroma_collection(document_store):
+    # The Haystack store has no batched get by id, so go to its Chroma collection
+    if hasattr(document_store, "_ensure_initialized"):
+        document_store._ensure_initialized()
+    return document_store._collection
+
+
+def load_vectors(document_store):
+    docs = [doc for doc in document_store.filter_documents() if doc.embedding is not None]
+    return [doc.id for doc in docs], np.asarray([doc.embedding for doc in docs], dtype=np.float32)
+
+
+def compress_store(document_store, store_path, method, metric="l2", dims=None,
+                   rescore_factor=DEFAULT_RESCORE_FACTOR, save=True):
+    """Build (and by default save) the compact index for one Chroma store."""
+    started = time.perf_counter()
+    ids, vectors = load_vectors(document_store)
+    if not ids:
+        raise ValueError(f"No embedded documents in {store_path}")
+    index = CompactIndex.build(ids, vectors, method, metric, dims, rescore_factor)
+    if save:
+        index.save(store_path)
+    logger.info(
+        f"Compact {method} index for {store_path}: {len(ids)} vectors, "
+        f"{index.memory_bytes() / 2**20:.1f} MiB added beside {vectors.nbytes / 2**20:.1f} MiB of float32 "
+        f"vectors in {time.perf_counter() - started:.1f}s"
+    )
+    return index
+
+
+@component
+class CompactRetriever:
+    """Scans a compact index, rescores with Chroma's stored vectors and fetches the hits in one call.
+
+    Filtered queries go to a regular Chroma retriever, since the compact
+    index holds no metadata.
+    """
+
+    def __init__(self, document_store: Any, index: CompactIndex, top_k: int = 10):
+        self.document_store = document_store
+        self.index = index
+        self.top_k = top_k
+        self._fallback = ChromaEmbeddingRetriever(document_store=document_store, top_k=top_k)
+
+    def _vectors(self, ids):
+        result = chroma_collection(self.document_store).get(ids=ids, include=["embeddings"])
+        return dict(zip(result["ids"], result["embeddings"]))
+
+    def _documents(self, rankings):
+        # One get for the hits of every query
+        ids = list(dict.fromkeys(doc_id for hits in rankings for doc_id, _, _ in hits))
+        if not ids:
+            return [[] for _ in rankings]
+        result = chroma_collection(self.document_store).get(ids=ids, include=["documents", "metadatas"])
+        found = {
+            doc_id: (content, meta)
+            for doc_id, content, meta in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+        return [
+            [
+                Document(
+                    id=doc_id,
+                    content=found[doc_id][0],
+                    meta=found[doc_id][1] or {},
+                    score=distance,
+                    # Already fetched for rescoring; MMR needs it
+                    embedding=vector.tolist() if vector is not None else None,
+                )
+                for doc_id, distance, vector in hits
+                if doc_id in found
+            ]
+            for hits in rankings
+        ]
+
+    def search_batch(self, query_embeddings, top_k=None):
+        """One document list per query; the candidates of all queries are rescored from one ``get``."""
+        top_k = top_k or self.top_k
+        index = self.index
+        if not index.rescore_factor:
+            return self._documents([index.search(query, top_k) for query in query_embeddings])
+        candidates = [
+            [index.ids[row] for row in index.first_pass(query, top_k * index.rescore_factor)[0]]
+            for query in query_embeddings
+        ]
+        vectors = self._vectors(list(dict.fromkeys(doc_id for ids in candidates for doc_id in ids)))
+        return self._documents([
+            index.rescore(query, ids, vectors, top_k) for query, ids in zip(query_embeddings, candidates)
+        ])
+
+    @component.output_types(documents=List[Document])
+    def run(
+        self,
+        query_embedding: List[float],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+    ):
+        top_k = top_k or self.top_k
+        if filters:
+            return self._fallback.run(query_embedding=query_embedding, filters=filters, top_k=top_k)
+
+        hits = self.index.search(query_embedding, top_k, vector_source=self._vectors)
+        return {"documents": self._documents([hits])[0]}
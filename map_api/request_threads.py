@@ -0,0 +1,64 @@
+"""Track which threads are working on behalf of one request.
+
+Work submitted to a thread pool with ``follow(fn)`` runs as part of the
+group of the submitting thread, if it has one, so a request's group also
+covers the speculative-retrieval and shard-query workers it fans out to.
+Unless a group is active, ``follow`` returns ``fn`` unchanged. Like
+``sharding`` this module has no Django dependency.
+"""
+import threading
+
+_groups = {}  # thread ident -> ThreadGroup it currently works for
+
+
+class ThreadGroup:
+    def __init__(self):
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def add(self, ident, name):
+        with self._lock:
+            self._threads[ident] = name
+
+    def discard(self, ident):
+        with self._lock:
+            self._threads.pop(ident, None)
+
+    def snapshot(self):
+        """``{ident: thread name}`` of the threads working for the group right now."""
+        with self._lock:
+            return dict(self._threads)
+
+    def join(self):
+        """Make the calling thread a member until ``leave()``."""
+        ident = threading.get_ident()
+        _groups[ident] = self
+        self.add(ident, threading.current_thread().name)
+
+    def leave(self):
+        ident = threading.get_ident()
+        if _groups.get(ident) is self:
+            del _groups[ident]
+        self.discard(ident)
+
+
+def follow(fn):
+    group = _groups.get(threading.get_ident())
+    if group is None:
+        return fn
+
+    def run(*args, **kwargs):
+        ident = threading.get_ident()
+        previous = _groups.get(ident)
+        _groups[ident] = group
+        group.add(ident, threading.current_thread().name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            group.discard(ident)
+            if previous is None:
+                _groups.pop(ident, None)
+            else:
+                _groups[ident] = previous
+
+    return run
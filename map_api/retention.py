@@ -0,0 +1,231 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import ChatMessageHistory
+
+from datetime import timedelta
+from pathlib import Path
+import gzip
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION = {
+    "max_turns_per_user": 50,
+    "max_age_days": 90,
+    "compact_after_days": 7,
+    "summary_line_chars": 240,  # Per summarized turn: the question and the answer's opening sentence
+    "summary_chars": 4000,
+    "archive_dir": "./data/archive/chat_history",
+    "batch_size": 500,
+    "incremental_every": 50,
+}
+
+ARCHIVE_FIELDS = (
+    "id", "user_id", "user__username", "session_key", "role", "content", "timestamp",
+    "embedding", "structured_data", "retrieved_documents", "compacted",
+)
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+_turns_since_sweep = 0
+_written_since_sweep = set()
+
+
+def get_retention_config(**overrides):
+    config = {**DEFAULT_RETENTION, **getattr(settings, "CHAT_HISTORY_RETENTION", {})}
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    return config
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def archive_and_delete(ids, config, dry_run=False):
+    """Write the given rows to a gzipped JSONL file, then delete them."""
+    ids = sorted(ids)
+    if not ids or dry_run:
+        return len(ids)
+
+    archive_dir = config["archive_dir"]
+    if archive_dir:
+        path = Path(archive_dir) / f"chat_history-{timezone.now():%Y%m%d-%H%M%S-%f}.jsonl.gz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(path, "wt", encoding="utf-8") as out:
+            for batch in _batches(ids, config["batch_size"]):
+                rows = ChatMessageHistory.objects.filter(id__in=batch).order_by("id").values(*ARCHIVE_FIELDS)
+                for row in rows:
+                    row["timestamp"] = row["timestamp"].isoformat()
+                    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        logger.info(f"Archived {len(ids)} chat rows to {path}")
+
+    # Only delete once the archive file is fully written and closed
+    for batch in _batches(ids, config["batch_size"]):
+        ChatMessageHistory.objects.filter(id__in=batch).delete()
+    return len(ids)
+
+
+def _scoped(queryset, conversations):
+    """Restrict ``queryset`` to the given ``(user_id, session_key)`` conversations; ``None`` means all."""
+    if conversations is None:
+        return queryset
+    scope = Q(pk__in=[])
+    for user_id, session_key in conversations:
+        scope |= Q(user_id=user_id, session_key=session_key)
+    return queryset.filter(scope)
+
+
+def excess_turn_ids(config, conversations=None):
+    max_rows = config["max_turns_per_user"] * 2
+    # Each anonymous session is its own conversation under the shared guest user
+    over_limit = (
+        _scoped(ChatMessageHistory.objects.order_by(), conversations)
+        .values("user", "session_key")
+        .annotate(rows=Count("id"))
+        .filter(rows__gt=max_rows)
+    )
+    ids = []
+    for entry in over_limit:
+        ids.extend(
+            ChatMessageHistory.objects.filter(user_id=entry["user"], session_key=entry["session_key"])
+            .order_by("-timestamp", "-id")
+            .values_list("id", flat=True)[max_rows:]
+        )
+    return ids
+
+
+def expired_ids(config, conversations=None):
+    cutoff = timezone.now() - timedelta(days=config["max_age_days"])
+    rows = _scoped(ChatMessageHistory.objects.filter(timestamp__lt=cutoff), conversations)
+    return list(rows.values_list("id", flat=True))
+
+
+def _opening(text, limit):
+    answer = text.split("Locations:")[0].strip()
+    sentence = SENTENCE_END.split(answer, maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 3].rstrip() + "..."
+
+
+def summarize_turns(rows, config):
+    """One summary row built from old ``(question, assistant_row)`` pairs of a conversation.
+
+    The content lists each question with the opening sentence of its answer,
+    the structured data keeps the distinct entity names and the documents
+    keep the distinct sources.
+    """
+    lines, entities, sources = [], {}, {}
+    for question, entry in rows:
+        line = f"- {question.strip()}: " if question else "- "
+        lines.append(line + _opening(entry.content, max(config["summary_line_chars"] - len(line), 40)))
+        for section, items in (entry.structured_data or {}).items():
+            names = entities.setdefault(section, {})
+            for item in items:
+                names.setdefault(item.get("name", ""), None)
+        for doc in entry.retrieved_documents or []:
+            sources.setdefault(doc.get("file_path", "Unknown"), None)
+
+    header = f"Summary of {len(rows)} earlier turns ({rows[0][1].timestamp:%Y-%m-%d} to {rows[-1][1].timestamp:%Y-%m-%d}):"
+    content = "\n".join([header, *lines])
+    if len(content) > config["summary_chars"]:
+        content = content[:config["summary_chars"] - 3].rstrip() + "..."
+    last = rows[-1][1]
+    return ChatMessageHistory(
+        user_id=last.user_id,
+        session_key=last.session_key,
+        role="assistant",
+        content=content,
+        embedding=last.embedding,
+        structured_data={
+            section: [{"name": name} for name in names if name] for section, names in entities.items()
+        },
+        retrieved_documents=[{"file_path": path} for path in sources],
+        compacted=True,
+    )
+
+
+def compact_old_turns(config, conversations=None, exclude=(), dry_run=False):
+    """Replace each conversation's old assistant rows with one summary row.
+
+    The questions are kept, since they are short and feed the cache warm-up;
+    the replaced answers are archived first. Returns the number of answers
+    summarized.
+    """
+    cutoff = timezone.now() - timedelta(days=config["compact_after_days"])
+    old = _scoped(ChatMessageHistory.objects.filter(compacted=False, timestamp__lt=cutoff), conversations)
+    if dry_run:
+        # Rows the limits would already remove are not counted again
+        return len(set(old.filter(role="assistant").values_list("id", flat=True)) - set(exclude))
+
+    pending = old.filter(role="assistant").order_by().values("user", "session_key").distinct()
+    summaries, replaced = [], []
+    for entry in list(pending):
+        rows = old.filter(user_id=entry["user"], session_key=entry["session_key"]).order_by("timestamp", "id")
+        pairs, question = [], None
+        for row in rows:
+            if row.role == "user":
+                question = row.content
+            else:
+                pairs.append((question, row))
+                question = None
+        for batch in _batches(pairs, config["batch_size"]):
+            summaries.append((summarize_turns(batch, config), batch[-1][1].timestamp))
+            replaced.extend(row.id for _, row in batch)
+
+    with transaction.atomic():
+        for summary, timestamp in summaries:
+            summary.save()
+            # Keep the summary in the conversation's past rather than making it its newest row
+            ChatMessageHistory.objects.filter(pk=summary.pk).update(timestamp=timestamp)
+        archive_and_delete(replaced, config)
+    return len(replaced)
+
+
+def run_retention(dry_run=False, conversations=None, **overrides):
+    """Apply the turn limit, the age limit and compaction, in that order.
+
+    ``conversations`` limits the sweep to those ``(user_id, session_key)``
+    pairs. Each row is counted once: rows over the turn limit are not also
+    counted as expired, and neither are counted as compacted.
+    """
+    config = get_retention_config(**overrides)
+    excess = set(excess_turn_ids(config, conversations))
+    expired = set(expired_ids(config, conversations)) - excess
+    stats = {
+        "archived_over_limit": archive_and_delete(excess, config, dry_run),
+        "archived_expired": archive_and_delete(expired, config, dry_run),
+        "summarized": compact_old_turns(config, conversations, excess | expired, dry_run),
+    }
+    scope = "" if conversations is None else f" ({len(conversations)} conversations)"
+    logger.info(f"Chat history retention{scope}{' (dry run)' if dry_run else ''}: {stats}")
+    return stats
+
+
+def record_turn(user_id, session_key=""):
+    """Sweep the conversations written to since the last sweep, every ``incremental_every`` turns.
+
+    Called from the chat history writer thread, so it never runs concurrently
+    with itself and stays off the response path. Scoping the sweep to the
+    written conversations keeps it short; the full sweep is
+    ``manage.py prune_chat_history``.
+    """
+    global _turns_since_sweep
+    config = get_retention_config()
+    if not config["incremental_every"]:
+        return
+    _written_since_sweep.add((user_id, session_key))
+    _turns_since_sweep += 1
+    if _turns_since_sweep < config["incremental_every"]:
+        return
+    _turns_since_sweep = 0
+    conversations = set(_written_since_sweep)
+    _written_since_sweep.clear()
+    try:
+        run_retention(conversations=conversations)
+    except Exception:
+        logger.exception("Incremental chat history retention failed")
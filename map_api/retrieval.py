@@ -0,0 +1,232 @@
+from django.conf import settings
+
+from .store_versions import current_version, resolve_store_path
+from .sharding import build_retriever, existing_shard_paths
+from .quantization import chroma_collection, compact_signature
+from .metrics import CACHE_HITS, CACHE_MISSES
+
+from haystack import Document
+from haystack_integrations.document_stores.chroma import ChromaDocumentStore
+from haystack.components.embedders import SentenceTransformersTextEmbedder
+
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RELOAD_INTERVAL = getattr(settings, "VECTOR_STORE_RELOAD_INTERVAL", 30)
+EMBEDDING_CACHE_SIZE = getattr(settings, "QUERY_EMBEDDING_CACHE_SIZE", 2048)
+RETRIEVAL_CACHE_SIZE = getattr(settings, "RETRIEVAL_CACHE_SIZE", 512)
+
+retrieval_pipelines = {}
+_pipelines_lock = threading.Lock()
+_reloader = None
+
+
+def query_cache_key(text):
+    return " ".join(text.casefold().split())
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def keys(self):
+        with self._lock:
+            return list(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RetrievalPipeline:
+    """Query embedder and Chroma retriever over one published store version.
+
+    The components are run directly rather than through a Haystack Pipeline
+    so that a reloaded store can reuse the already loaded embedder model.
+    A sharded version gets a retriever that fans out over all its shards;
+    shards with a compact index are searched through it.
+
+    Query embeddings are cached by normalized text and survive store swaps.
+    Retrieval results are cached by normalized text and top_k for this store
+    version only, as ``(id, score)`` pairs that are re-read from Chroma on a
+    hit, so the cache holds no document text or embeddings.
+    """
+
+    def __init__(self, embedder, store_path, version=None, embedding_cache=None, distance_function="l2"):
+        self.embedder = embedder
+        self.store_path = store_path
+        self.version = version
+        self.distance_function = distance_function
+        paths = existing_shard_paths(store_path)
+        # compress_vectors adds compact indexes to a published version in place
+        self.signature = tuple(compact_signature(path) for path in paths)
+        self.stores = [ChromaDocumentStore(persist_path=path, distance_function=distance_function) for path in paths]
+        self.retriever = build_retriever(self.stores, paths, distance_function)
+        self.embedding_cache = embedding_cache if embedding_cache is not None else LRUCache(EMBEDDING_CACHE_SIZE)
+        self.retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE)
+
+    def cached_embedding(self, text):
+        embedding = self.embedding_cache.get(query_cache_key(text))
+        if embedding is None:
+            CACHE_MISSES.inc(cache="query_embedding")
+        else:
+            CACHE_HITS.inc(cache="query_embedding")
+        return embedding
+
+    def embed(self, text, cache=True):
+        embedding = self.embedder.run(text=text)["embedding"]
+        if cache:
+            self.embedding_cache.put(query_cache_key(text), embedding)
+        return embedding
+
+    def retrieve(self, text, query_embedding, top_k=None, cache=True):
+        """Retrieve for ``query_embedding``; ``cache=False`` for one-off texts such as history-enriched queries."""
+        key = (query_cache_key(text), top_k)
+        hits = self.retrieval_cache.get(key) if cache else None
+        if hits is not None:
+            documents = self._hydrate(hits)
+            if len(documents) == len(hits):
+                CACHE_HITS.inc(cache="retrieval")
+                return documents
+        if cache:
+            CACHE_MISSES.inc(cache="retrieval")
+        documents = self.retriever.run(query_embedding=query_embedding, top_k=top_k)["documents"]
+        if cache:
+            self.retrieval_cache.put(key, tuple((doc.id, doc.score) for doc in documents))
+        return documents
+
+    def _hydrate(self, hits):
+        ids = [doc_id for doc_id, _ in hits]
+        found = {}
+        for store in self.stores:
+            result = chroma_collection(store).get(ids=ids, include=["documents", "metadatas", "embeddings"])
+            embeddings = result.get("embeddings")
+            for i, doc_id in enumerate(result["ids"]):
+                found[doc_id] = (
+                    result["documents"][i],
+                    result["metadatas"][i] or {},
+                    list(embeddings[i]) if embeddings is not None else None,
+                )
+        return [
+            Document(id=doc_id, content=found[doc_id][0], meta=found[doc_id][1], embedding=found[doc_id][2], score=score)
+            for doc_id, score in hits
+            if doc_id in found
+        ]
+
+    def warm_up(self, queries=()):
+        """Load the model and open the store, then optionally fill the retrieval cache.
+
+        ``queries`` are ``(text, top_k)`` pairs, e.g. the keys of the retrieval
+        cache of the version this one replaces.
+        """
+        self.embedder.warm_up()
+        # Opens the collection and pages in the index before live traffic does
+        embedding = self.embedder.run(text="warm up")["embedding"]
+        self.retriever.run(query_embedding=embedding, top_k=1)
+        for text, top_k in queries:
+            self.retrieve(text, self.embedding_cache.get(text) or self.embed(text), top_k)
+
+
+def get_retrieval_pipeline(embedding_type="e5"):
+    pipeline = retrieval_pipelines.get(embedding_type)
+    if pipeline is not None:
+        return pipeline
+
+    with _pipelines_lock:
+        if embedding_type not in retrieval_pipelines:
+            config = settings.EMBEDDING_MODELS.get(embedding_type)
+            if not config:
+                raise ValueError("Invalid embedding type")
+            embedder = SentenceTransformersTextEmbedder(model=config["name"])
+            pipeline = RetrievalPipeline(
+                embedder,
+                resolve_store_path(config["path"]),
+                current_version(config["path"]),
+                distance_function=config.get("distance_function", "l2"),
+            )
+            pipeline.warm_up()
+            retrieval_pipelines[embedding_type] = pipeline
+            _start_reloader()
+        return retrieval_pipelines[embedding_type]
+
+
+def fetch_document(embedding_type, doc_id):
+    for store in get_retrieval_pipeline(embedding_type).stores:
+        found = store.filter_documents(filters={"field": "id", "operator": "==", "value": doc_id})
+        if found:
+            return found[0]
+    return None
+
+
+def reload_stores():
+    """Swap in any newly published store versions.
+
+    The new store is warmed, including its retrieval cache, before the swap. Requests that already hold the
+    old pipeline finish on it; it is released once they drop the reference.
+    """
+    for embedding_type, pipeline in list(retrieval_pipelines.items()):
+        base = settings.EMBEDDING_MODELS[embedding_type]["path"]
+        store_path = resolve_store_path(base)
+        if store_path == pipeline.store_path and pipeline.signature == tuple(
+            compact_signature(path) for path in existing_shard_paths(store_path)
+        ):
+            continue
+
+        started = time.perf_counter()
+        try:
+            new_pipeline = RetrievalPipeline(
+                pipeline.embedder,
+                store_path,
+                current_version(base),
+                embedding_cache=pipeline.embedding_cache,
+                distance_function=pipeline.distance_function,
+            )
+            # Replay the queries that were hot on the old store so the swap does not empty the cache
+            new_pipeline.warm_up(pipeline.retrieval_cache.keys())
+        except Exception:
+            logger.exception(f"Failed to load new {embedding_type} store at {store_path}; keeping {pipeline.store_path}")
+            continue
+
+        with _pipelines_lock:
+            retrieval_pipelines[embedding_type] = new_pipeline
+        logger.info(
+            f"Swapped {embedding_type} store {pipeline.version or pipeline.store_path} -> "
+            f"{new_pipeline.version} (warmed in {time.perf_counter() - started:.2f}s)"
+        )
+
+
+def _reload_loop():
+    while True:
+        time.sleep(RELOAD_INTERVAL)
+        try:
+            reload_stores()
+        except Exception:
+            logger.exception("Vector store reload failed")
+
+
+def _start_reloader():
+    global _reloader
+    if _reloader is None and RELOAD_INTERVAL:
+        _reloader = threading.Thread(target=_reload_loop, name="vector-store-reloader", daemon=True)
+        _reloader.start()
@@ -3,11 +3,20 @@ from rest_framework import serializers
 class QuerySerializer(serializers.Serializer):
     query = serializers.CharField(min_length=5, max_length=150)
     embedding = serializers.ChoiceField(choices=['mpnet', 'e5'], default='e5')
+    # Optional MMR diversification of retrieved chunks; defaults come from settings.RAG_MMR
+    mmr_lambda = serializers.FloatField(min_value=0.0, max_value=1.0, required=False)
+    mmr_k = serializers.IntegerField(min_value=1, max_value=50, required=False)
+    per_file_limit = serializers.IntegerField(min_value=1, required=False)
+    # Compact responses carry document ids, scores and snippets instead of full text;
+    # the default comes from settings.RAG_COMPACT_RESPONSES
+    compact = serializers.BooleanField(required=False)
 
 class DocumentMetadataSerializer(serializers.Serializer):
     id = serializers.CharField(max_length=255)
     score = serializers.FloatField()
     content_snippet = serializers.CharField()
+    truncated = serializers.BooleanField(default=False)
+    file_path = serializers.CharField(required=False)
 
 class RAGResponseSerializer(serializers.Serializer):
     answer = serializers.CharField(help_text="Conversational reply from the LLM.")
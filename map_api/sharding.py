@@ -0,0 +1,134 @@
+"""Partitioning one model's vector store into N Chroma shards.
+
+A sharded store version holds ``shard-00`` .. ``shard-NN`` subdirectories; a
+version without them is a single unsharded store. Documents are assigned to
+shards by a hash of their source file (so a file's chunks stay together) or
+of the chunk id. Like ``store_versions`` this module has no Django
+dependency so the ingest scripts can use it.
+"""
+from haystack import Document, component
+from haystack_integrations.components.retrievers.chroma import ChromaEmbeddingRetriever
+
+from .quantization import CompactIndex, CompactRetriever, has_compact_index
+from .request_threads import follow
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import hashlib
+
+SHARD_PREFIX = "shard-"
+
+# Chroma reports all of these as distances (cosine and ip as 1 - similarity), and
+# so do compact indexes, so a smaller score is always the better match.
+DISTANCE_FUNCTIONS = {"l2", "cosine", "ip"}
+
+
+def shard_paths(store_path, shards):
+    if shards <= 1:
+        return [str(store_path)]
+    return [str(Path(store_path) / f"{SHARD_PREFIX}{i:02d}") for i in range(shards)]
+
+
+def existing_shard_paths(store_path):
+    base = Path(store_path)
+    shards = sorted(path for path in base.glob(f"{SHARD_PREFIX}*") if path.is_dir()) if base.is_dir() else []
+    return [str(path) for path in shards] or [str(base)]
+
+
+def shard_for(doc, shards, shard_key="file"):
+    key = doc.meta.get("file_path") if shard_key == "file" else None
+    key = key or doc.id
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") % shards
+
+
+@component
+class ShardedDocumentWriter:
+    def __init__(self, document_stores: List[Any], shard_key: str = "file"):
+        self.document_stores = document_stores
+        self.shard_key = shard_key
+
+    @component.output_types(documents_written=int)
+    def run(self, documents: List[Document]):
+        partitions = [[] for _ in self.document_stores]
+        for doc in documents:
+            partitions[shard_for(doc, len(self.document_stores), self.shard_key)].append(doc)
+        written = 0
+        for store, docs in zip(self.document_stores, partitions):
+            if docs:
+                written += store.write_documents(docs) or 0
+        return {"documents_written": written}
+
+
+@component
+class ShardedRetriever:
+    """Queries every shard's retriever in parallel and merges the per-shard top-k globally.
+
+    Every ``distance_function`` is a distance, so the merge keeps the lowest scores.
+    """
+
+    def __init__(self, retrievers: List[Any], top_k: int = 10, distance_function: str = "l2"):
+        if distance_function not in DISTANCE_FUNCTIONS:
+            raise ValueError(f"Unknown distance function {distance_function!r}")
+        self.top_k = top_k
+        self.retrievers = retrievers
+        self._pool = ThreadPoolExecutor(max_workers=len(self.retrievers), thread_name_prefix="shard-query")
+
+    @component.output_types(documents=List[Document])
+    def run(
+        self,
+        query_embedding: List[float],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+    ):
+        top_k = top_k or self.top_k
+        futures = [
+            self._pool.submit(follow(retriever.run), query_embedding=query_embedding, filters=filters, top_k=top_k)
+            for retriever in self.retrievers
+        ]
+        return {"documents": self._merge([future.result()["documents"] for future in futures], top_k)}
+
+    def search_batch(self, query_embeddings: List[List[float]], top_k: Optional[int] = None):
+        """One merged document list per query; each shard is queried once for the whole batch."""
+        top_k = top_k or self.top_k
+        futures = [
+            self._pool.submit(search_batch, retriever, query_embeddings, top_k) for retriever in self.retrievers
+        ]
+        per_shard = [future.result() for future in futures]
+        return [self._merge(rankings, top_k) for rankings in zip(*per_shard)]
+
+    def _merge(self, rankings, top_k):
+        merged = [doc for docs in rankings for doc in docs]
+        merged.sort(key=lambda doc: float("inf") if doc.score is None else doc.score)
+        return merged[:top_k]
+
+
+def search_batch(retriever, query_embeddings, top_k):
+    """Retrieve for many query embeddings at once with a retriever from ``build_retriever``.
+
+    A plain Chroma store answers the whole batch in one ``query`` call
+    instead of one call per embedding.
+    """
+    if hasattr(retriever, "search_batch"):
+        return retriever.search_batch(query_embeddings, top_k)
+    return retriever.document_store.search_embeddings(query_embeddings, top_k)
+
+
+def build_retriever(document_stores, store_paths=None, distance_function=None):
+    """A single retriever for one store, a fan-out retriever for several shards.
+
+    When ``store_paths`` is given, shards that carry a compact index are
+    searched through it instead of through Chroma's own index.
+    ``distance_function`` defaults to the one the stores were opened with.
+    """
+    if distance_function is None:
+        distance_function = getattr(document_stores[0], "_distance_function", "l2")
+    retrievers = []
+    for store, path in zip(document_stores, store_paths or [None] * len(document_stores)):
+        if path and has_compact_index(path):
+            retrievers.append(CompactRetriever(store, CompactIndex.load(path)))
+        else:
+            retrievers.append(ChromaEmbeddingRetriever(document_store=store))
+    if len(retrievers) == 1:
+        return retrievers[0]
+    return ShardedRetriever(retrievers, distance_function=distance_function)
@@ -0,0 +1,66 @@
+"""Versioned vector store directories with an atomic "current" pointer.
+
+Each ingest run writes into ``<base>/versions/<version>/`` and then publishes
+it by atomically replacing ``<base>/CURRENT``. A base directory without a
+pointer is used as-is, so stores built before versioning keep working.
+
+This module has no Django dependency so the ingest scripts can import it.
+"""
+from datetime import datetime
+from pathlib import Path
+import os
+import shutil
+
+POINTER_NAME = "CURRENT"
+VERSIONS_DIR = "versions"
+
+
+def current_version(base):
+    try:
+        version = (Path(base) / POINTER_NAME).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+
+def version_path(base, version):
+    return str(Path(base) / VERSIONS_DIR / version)
+
+
+def resolve_store_path(base):
+    version = current_version(base)
+    return version_path(base, version) if version else str(base)
+
+
+def new_version(base):
+    version = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = version_path(base, version)
+    os.makedirs(path, exist_ok=False)
+    return version, path
+
+
+def publish_version(base, version):
+    if not os.path.isdir(version_path(base, version)):
+        raise FileNotFoundError(f"Store version {version} does not exist under {base}")
+    pointer = Path(base) / POINTER_NAME
+    tmp = pointer.with_name(f"{POINTER_NAME}.{os.getpid()}.tmp")
+    tmp.write_text(version + "\n", encoding="utf-8")
+    os.replace(tmp, pointer)
+
+
+def list_versions(base):
+    versions_dir = Path(base) / VERSIONS_DIR
+    if not versions_dir.is_dir():
+        return []
+    return sorted(path.name for path in versions_dir.iterdir() if path.is_dir())
+
+
+def prune_versions(base, keep):
+    """Delete all but the newest ``keep`` versions, never the current one."""
+    current = current_version(base)
+    removed = []
+    for version in list_versions(base)[:-keep] if keep else list_versions(base):
+        if version != current:
+            shutil.rmtree(version_path(base, version))
+            removed.append(version)
+    return removed
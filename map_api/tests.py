@@ -1,3 +1,366 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from haystack import Document
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from types import SimpleNamespace
+from pathlib import Path
+from unittest import mock
+import fcntl
+import os
+import re
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from . import views
+from .admission import Overloaded, StageLimiter, request_deadline
+from .chunking import TokenAwareSplitter
+from .coalesce import DEFAULT_COALESCING, SingleFlight
+from .dedup import NearDuplicateFilter
+from .diversify import mmr_select
+from .quantization import CompactIndex, exact_distances
+from .context import estimate_tokens, pack_context
+from .metrics import StageTimer
+
+
+class FakeRetrievalPipeline:
+    def __init__(self):
+        self.embed_threads = []
+
+    def cached_embedding(self, text):
+        return None
+
+    def embed(self, text, cache=True):
+        self.embed_threads.append(threading.get_ident())
+        return [1.0, 0.0]
+
+    def retrieve(self, text, query_embedding, top_k=None, **kwargs):
+        return [Document(content="Rome was founded in 753 BC.", meta={"file_path": "rome.pdf"}, score=0.1)]
+
+
+class FakeGenerationPipeline:
+    def run(self, data):
+        reply = SimpleNamespace(text="Rome was founded in 753 BC.\nLocations:\n- Rome: the city")
+        return {"generator": {"replies": [reply]}}
+
+
+class SpeculativeRetrievalTests(SimpleTestCase):
+    def test_no_history_embeds_once_without_pool_hop(self):
+        pipeline = FakeRetrievalPipeline()
+        conversation = SimpleNamespace(summary="")
+        with mock.patch.object(views, "get_retrieval_pipeline", return_value=pipeline), \
+                mock.patch.object(views, "get_generation_pipeline", return_value=FakeGenerationPipeline()), \
+                mock.patch.object(views, "speculation_pool") as pool:
+            result = views.answer_query("When was Rome founded?", "e5", conversation, StageTimer(), request_deadline())
+
+        self.assertEqual(pipeline.embed_threads, [threading.get_ident()])
+        pool.submit.assert_not_called()
+        self.assertEqual(result["documents"][0]["file_path"], "rome.pdf")
+
+    def test_keywords_already_in_query_reuse_raw_branch(self):
+        pipeline = FakeRetrievalPipeline()
+        conversation = SimpleNamespace(summary="Q: Rome?\nA: A city.", keywords=lambda extractor: ["Rome"])
+        with mock.patch.object(views, "SPECULATIVE_RETRIEVAL", False):
+            docs, _ = views.retrieve_with_history(
+                pipeline, "When was Rome founded?", conversation, StageTimer(), request_deadline()
+            )
+
+        self.assertEqual(len(pipeline.embed_threads), 1)
+        self.assertEqual(len(docs), 1)
+
+    def test_call_abandoned_while_queued_does_not_embed(self):
+        pipeline = FakeRetrievalPipeline()
+        abandoned = threading.Event()
+
+        @contextmanager
+        def slot(timer, deadline, queue_stage):
+            abandoned.set()  # The request moves on while this call waits for its slot
+            yield
+
+        with mock.patch.object(views, "embedding_slot", slot):
+            result = views.retrieve_documents(
+                pipeline, "When was Rome founded?", StageTimer(), request_deadline(), abandoned=abandoned
+            )
+
+        self.assertIsNone(result)
+        self.assertEqual(pipeline.embed_threads, [])
+
+
+class AdmissionTests(SimpleTestCase):
+    def hold_slot(self, limiter):
+        entered, release = threading.Event(), threading.Event()
+
+        def hold():
+            with limiter.slot(time.monotonic() + 5):
+                entered.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        entered.wait(5)
+        self.addCleanup(holder.join)
+        self.addCleanup(release.set)
+
+    def test_waiter_is_shed_once_its_deadline_passes(self):
+        limiter = StageLimiter("test", max_concurrent=1, max_queue=4)
+        limiter.avg_service = 0.0  # Queue rather than reject up front on the expected wait
+        self.hold_slot(limiter)
+
+        started = time.monotonic()
+        with self.assertRaises(Overloaded) as shed:
+            with limiter.slot(started + 0.1):
+                pass
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        self.assertEqual(shed.exception.reason, "deadline")
+        self.assertEqual(shed.exception.status, 503)
+        self.assertEqual(limiter.waiting, 0)
+
+    def test_full_queue_is_rejected_with_429(self):
+        limiter = StageLimiter("test", max_concurrent=1, max_queue=0)
+        self.hold_slot(limiter)
+
+        with self.assertRaises(Overloaded) as shed:
+            with limiter.slot(time.monotonic() + 5):
+                pass
+
+        self.assertEqual(shed.exception.reason, "queue_full")
+        self.assertEqual(shed.exception.status, 429)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def flight(self, **config):
+        return SingleFlight({**DEFAULT_COALESCING, **config})
+
+    def test_followers_share_the_leaders_result(self):
+        flight = self.flight(cross_process=False)
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(threading.get_ident())
+            started.set()
+            release.wait(5)
+            return {"answer": 42}
+
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            leader = pool.submit(flight.do, "key", compute)
+            started.wait(5)
+            followers = [pool.submit(flight.do, "key", compute) for _ in range(5)]
+            time.sleep(0.1)  # Let the followers reach the wait
+            release.set()
+            results = [leader.result(5)] + [follower.result(5) for follower in followers]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[0], ({"answer": 42}, False))
+        self.assertEqual(results[1:], [({"answer": 42}, True)] * 5)
+
+    def test_follower_gives_up_at_its_deadline(self):
+        flight = self.flight(cross_process=False)
+        started, release = threading.Event(), threading.Event()
+
+        def compute():
+            started.set()
+            release.wait(5)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            leader = pool.submit(flight.do, "key", compute)
+            started.wait(5)
+            try:
+                with self.assertRaises(Overloaded):
+                    flight.do("key", compute, deadline=time.monotonic() + 0.05)
+            finally:
+                release.set()
+            leader.result(5)
+
+    def test_result_file_is_not_reused_by_a_later_request(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            flight = self.flight(cross_process=True, lock_dir=lock_dir, result_ttl=60)
+            calls = []
+
+            def compute():
+                calls.append(1)
+                return len(calls)
+
+            self.assertEqual(flight.do("key", compute), (1, False))
+            self.assertEqual(flight.do("key", compute), (2, False))
+
+    def test_prune_keeps_old_lock_files_that_are_held(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            flight = self.flight(cross_process=True, lock_dir=lock_dir)
+            held, idle = Path(lock_dir) / "held.lock", Path(lock_dir) / "idle.lock"
+            for path in (held, idle):
+                path.touch()
+                os.utime(path, (0, 0))  # Holding a lock never updates mtime
+
+            with open(held, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                flight._prune(Path(lock_dir))
+
+            self.assertTrue(held.exists())
+            self.assertFalse(idle.exists())
+
+
+class ContextPackingTests(SimpleTestCase):
+    def test_stays_within_the_token_budget(self):
+        docs = [Document(content=" ".join(f"Sentence {i} of chunk {n} about Rome." for i in range(40)))
+                for n in range(5)]
+
+        passages, used = pack_context(docs, budget=200)
+
+        self.assertLessEqual(sum(estimate_tokens(passage) for passage in passages), 200)
+        self.assertEqual(used, docs[:len(passages)])
+        self.assertTrue(passages[-1].endswith("."))  # Cut at a sentence boundary
+
+    def test_drops_sentences_repeated_by_chunk_overlap(self):
+        first = Document(content="Rome was founded in 753 BC. Romulus was its first king.")
+        second = Document(content="Romulus was its first king. Numa Pompilius succeeded him.")
+
+        passages, _ = pack_context([first, second], budget=1000)
+
+        self.assertEqual(passages, [first.content, "Numa Pompilius succeeded him."])
+
+    def test_skips_near_duplicate_passages(self):
+        text = "The Roman Republic was governed by two consuls elected every year by the citizens of Rome"
+        docs = [Document(content=text + "."), Document(content=text + " assembly."),
+                Document(content="Carthage was a Phoenician city in North Africa.")]
+
+        passages, used = pack_context(docs, budget=1000)
+
+        self.assertEqual(used, [docs[0], docs[2]])
+        self.assertEqual(len(passages), 2)
+
+
+class WhitespaceTokenizer:
+    """One token per word, with the call signature TokenAwareSplitter uses."""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+        if isinstance(text, list):
+            return {"input_ids": [sentence.split() for sentence in text]}
+        offsets = [match.span() for match in re.finditer(r"\S+", text)]
+        return {"input_ids": list(range(len(offsets))), "offset_mapping": offsets}
+
+
+class ChunkingTests(SimpleTestCase):
+    def splitter(self, chunk_tokens, overlap_tokens):
+        splitter = TokenAwareSplitter(model="test", chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
+        splitter._tokenizer = WhitespaceTokenizer()
+        return splitter
+
+    def test_consecutive_chunks_overlap_by_trailing_sentences(self):
+        sentences = [f"Sentence number {i}." for i in range(6)]
+        chunks = self.splitter(chunk_tokens=8, overlap_tokens=4).run([Document(content=" ".join(sentences))])["documents"]
+
+        # Three tokens per sentence: two fit in a chunk and the second is carried into the next
+        self.assertEqual(
+            [chunk.content for chunk in chunks],
+            [" ".join(sentences[i:i + 2]) for i in range(5)],
+        )
+        self.assertEqual([chunk.meta["token_count"] for chunk in chunks], [6] * 5)
+
+    def test_long_sentence_is_cut_into_overlapping_windows(self):
+        words = [f"w{i}" for i in range(20)]
+        pieces = self.splitter(chunk_tokens=8, overlap_tokens=4)._split_text(" ".join(words) + ".")
+
+        self.assertEqual([tokens for _, tokens in pieces], [8, 8, 8, 8])
+        for (previous, _), (current, _) in zip(pieces, pieces[1:]):
+            self.assertEqual(previous.split()[-4:], current.split()[:4])
+        self.assertTrue(pieces[-1][0].endswith("w19."))
+
+
+class NearDuplicateTests(SimpleTestCase):
+    def test_reprint_is_folded_into_the_first_chunk(self):
+        text = " ".join(f"The legion marched from camp {i} along the road towards the northern frontier." for i in range(8))
+        original = Document(content=text, meta={"file_path": "edition_1.pdf"})
+        reprint = Document(content=text.replace("frontier.", "border.", 1), meta={"file_path": "edition_2.pdf"})
+        unrelated = Document(content="Carthage was founded by Phoenician settlers from Tyre on the coast of North Africa.",
+                             meta={"file_path": "carthage.pdf"})
+
+        dedup = NearDuplicateFilter(threshold=0.85)
+        kept = dedup.run([original, reprint, unrelated])["documents"]
+
+        self.assertEqual([doc.id for doc in kept], [original.id, unrelated.id])
+        self.assertEqual(kept[0].meta["source_file_paths"], "edition_1.pdf; edition_2.pdf")
+        self.assertEqual(kept[0].meta["duplicate_count"], 1)
+        self.assertEqual(kept[1].meta["duplicate_count"], 0)
+        self.assertEqual(dedup.last_report["removed"], 1)
+
+
+class MMRTests(SimpleTestCase):
+    def setUp(self):
+        self.best = Document(content="best", embedding=[0.95, 0.3, 0.0], meta={"file_path": "a.pdf"})
+        self.near_copy = Document(content="near copy", embedding=[0.94, 0.34, 0.0], meta={"file_path": "b.pdf"})
+        self.different = Document(content="different", embedding=[0.8, 0.0, 0.6], meta={"file_path": "c.pdf"})
+        self.docs = [self.best, self.near_copy, self.different]
+
+    def test_lambda_one_keeps_relevance_order(self):
+        selected = mmr_select([1.0, 0.0, 0.0], self.docs, k=2, lambda_mult=1.0)
+        self.assertEqual(selected, [self.best, self.near_copy])
+
+    def test_diversity_prefers_a_different_document_over_a_near_copy(self):
+        selected = mmr_select([1.0, 0.0, 0.0], self.docs, k=2, lambda_mult=0.5)
+        self.assertEqual(selected, [self.best, self.different])
+
+    def test_per_file_limit_and_unscored_documents(self):
+        self.near_copy.meta["file_path"] = "a.pdf"
+        unscored = Document(content="no embedding", meta={"file_path": "d.pdf"})
+
+        selected = mmr_select([1.0, 0.0, 0.0], self.docs + [unscored], k=4, lambda_mult=1.0, per_file_limit=1)
+
+        self.assertEqual(selected, [self.best, self.different, unscored])
+
+
+class CompactIndexTests(SimpleTestCase):
+    def setUp(self):
+        # Embeddings with low intrinsic dimension, like real ones, so PCA has structure to keep
+        rng = np.random.default_rng(0)
+        self.vectors = (rng.normal(size=(2000, 16)) @ rng.normal(size=(16, 64))
+                        + 0.01 * rng.normal(size=(2000, 64))).astype(np.float32)
+        self.ids = [f"doc-{i}" for i in range(len(self.vectors))]
+        picks = rng.choice(len(self.vectors), 50, replace=False)
+        self.queries = self.vectors[picks] + 0.1 * rng.normal(size=(50, 64)).astype(np.float32)
+        self.lookup = dict(zip(self.ids, self.vectors))
+
+    def recall(self, index, metric, **search):
+        total = 0.0
+        for query in self.queries:
+            exact = {self.ids[i] for i in np.argsort(exact_distances(query, self.vectors, metric))[:10]}
+            total += len(exact & {doc_id for doc_id, _, _ in index.search(query, 10, **search)}) / 10
+        return total / len(self.queries)
+
+    def test_round_trip_keeps_recall(self):
+        for method in ("int8", "pca"):
+            for metric in ("l2", "cosine"):
+                with self.subTest(method=method, metric=metric), tempfile.TemporaryDirectory() as store_path:
+                    CompactIndex.build(self.ids, self.vectors, method, metric, dims=16).save(store_path)
+                    index = CompactIndex.load(store_path)
+
+                    self.assertEqual(index.ids, self.ids)
+                    self.assertGreaterEqual(self.recall(index, metric, rescore_factor=0), 0.9)
+                    rescored = self.recall(
+                        index, metric, vector_source=lambda ids: {i: self.lookup[i] for i in ids}
+                    )
+                    self.assertGreaterEqual(rescored, 0.98)
+
+    def test_codes_are_compact(self):
+        int8 = CompactIndex.build(self.ids, self.vectors, "int8")
+        pca = CompactIndex.build(self.ids, self.vectors, "pca", dims=16)
+
+        self.assertEqual(int8.codes.dtype, np.int8)
+        self.assertEqual(pca.codes.shape, (len(self.ids), 16))
+        self.assertLess(pca.memory_bytes(), self.vectors.nbytes / 4)
+
+
+class StageTimerTests(SimpleTestCase):
+    def test_records_after_finish_are_dropped(self):
+        timer = StageTimer()
+        timer.record("embedding", 0.01)
+        timer.finish()
+        timer.record("speculative_embedding_queue", 0.5)  # A pool thread still running after the response
+
+        self.assertEqual(set(timer.durations), {"embedding", "total"})
+        self.assertNotIn("speculative", timer.server_timing())
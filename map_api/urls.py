@@ -1,7 +1,10 @@
 from django.urls import path
-from .views import RAGQueryAPIView, ClearChatAPIView
+from .views import RAGQueryAPIView, ClearChatAPIView, DocumentDetailAPIView, MetricsAPIView, ProfileDownloadAPIView
 
 urlpatterns = [
     path('rag-query/', RAGQueryAPIView.as_view(), name='rag_query_api'),
     path('clear-chat/', ClearChatAPIView.as_view(), name='clear-chat'),
+    path('documents/<str:doc_id>/', DocumentDetailAPIView.as_view(), name='document-detail'),
+    path('metrics/', MetricsAPIView.as_view(), name='metrics'),
+    path('profiles/<str:name>/', ProfileDownloadAPIView.as_view(), name='profile-download'),
 ]
\ No newline at end of file
@@ -2,55 +2,65 @@ from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import AllowAny
-from django.contrib.auth.models import User
-
-from .serializers import QuerySerializer
-from .models import ChatMessageHistory
+from rest_framework.permissions import AllowAny, IsAdminUser
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.http import parse_etags
+
+from .serializers import DocumentMetadataSerializer, QuerySerializer
+from .conversation import get_conversation
+from .context import build_context, estimate_tokens
+from .coalesce import coalescing_key, single_flight
+from .local_generator import LocalChatGenerator
+from .retrieval import fetch_document, get_retrieval_pipeline
+from .diversify import DEFAULT_MMR, mmr_select
+from .admission import Overloaded, admission_slot, request_deadline
+from .profiling import get_profile_path, start_request_profile
+from .request_threads import follow
+from .metrics import (
+    CACHE_HITS, CACHE_MISSES, DOCUMENTS_RETRIEVED, PROMPT_TOKENS, SPECULATION_OUTCOMES, StageTimer, render_metrics
+)
 
 from haystack import Pipeline
-from haystack_integrations.document_stores.chroma import ChromaDocumentStore
-from haystack.components.embedders import SentenceTransformersTextEmbedder
-from haystack_integrations.components.retrievers.chroma import ChromaEmbeddingRetriever
 from haystack_integrations.components.generators.google_genai import GoogleGenAIChatGenerator
 from haystack.dataclasses.chat_message import ChatMessage
 
-import logging, json, re
+import hashlib, logging, json, re, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 import spacy
 from sentence_transformers import SentenceTransformer, util
 
 logger = logging.getLogger(__name__)
 
-retrieval_pipelines = {}
 generation_pipeline = None
 
+GENERATION_MODEL = getattr(settings, "GENERATION_MODEL", "gemini-1.5-flash")
+SPECULATIVE_RETRIEVAL = getattr(settings, "RAG_SPECULATIVE_RETRIEVAL", True)
+COMPACT_RESPONSES = getattr(settings, "RAG_COMPACT_RESPONSES", False)
+SNIPPET_CHARS = getattr(settings, "RAG_SNIPPET_CHARS", 300)
+DOCUMENT_CACHE_MAX_AGE = getattr(settings, "DOCUMENT_CACHE_MAX_AGE", 86400)
+
+speculation_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, "RAG_SPECULATION_WORKERS", 4), thread_name_prefix="rag-speculative"
+)
+
 # Load once
 nlp = spacy.load("en_core_web_sm")
 bert_model = SentenceTransformer("all-MiniLM-L6-v2")
 
-def get_retrieval_pipeline(embedding_type="e5"):
-    if embedding_type not in retrieval_pipelines:
-        config = settings.EMBEDDING_MODELS.get(embedding_type)
-        if not config:
-            raise ValueError("Invalid embedding type")
-        store = ChromaDocumentStore(persist_path=config["path"])
-        pipeline = Pipeline()
-        pipeline.add_component("embedder", SentenceTransformersTextEmbedder(model=config["name"]))
-        pipeline.add_component("retriever", ChromaEmbeddingRetriever(document_store=store))
-        pipeline.connect("embedder.embedding", "retriever.query_embedding")
-        pipeline.warm_up()
-        retrieval_pipelines[embedding_type] = pipeline
-    return retrieval_pipelines[embedding_type]
-
 def get_generation_pipeline():
     global generation_pipeline
     if generation_pipeline is None:
+        if getattr(settings, "GENERATOR_BACKEND", "gemini") == "local":
+            generator = LocalChatGenerator(**getattr(settings, "LOCAL_GENERATOR", {}))
+        else:
+            generator = GoogleGenAIChatGenerator(model=GENERATION_MODEL)
         generation_pipeline = Pipeline()
-        generation_pipeline.add_component("generator", GoogleGenAIChatGenerator(model="gemini-1.5-flash"))
+        generation_pipeline.add_component("generator", generator)
         generation_pipeline.warm_up()
     return generation_pipeline
 
-def extract_keywords(texts, top_k=10):
+def extract_keywords(texts, top_k=10, encode_slot=nullcontext):
     all_phrases = []
     for text in texts:
         doc = nlp(text)
@@ -61,24 +71,230 @@ def extract_keywords(texts, top_k=10):
         return []
 
     unique_phrases = list(set(all_phrases))
-    phrase_embeddings = bert_model.encode(unique_phrases, convert_to_tensor=True)
-    question_embedding = bert_model.encode(" ".join(texts), convert_to_tensor=True)
+    # Only the MiniLM encodes compete with the query embedder; spaCy runs outside the slot
+    with encode_slot():
+        phrase_embeddings = bert_model.encode(unique_phrases, convert_to_tensor=True)
+        question_embedding = bert_model.encode(" ".join(texts), convert_to_tensor=True)
 
     scores = util.cos_sim(question_embedding, phrase_embeddings)[0]
     top_indices = scores.argsort(descending=True)[:top_k]
     return [unique_phrases[i] for i in top_indices]
 
+def extract_section(llm_output, label):
+    pattern = rf"{label}:\s*(.*?)(?:\n\w+:|$)"
+    match = re.search(pattern, llm_output, re.DOTALL | re.IGNORECASE)
+    return match.group(1).strip() if match else ""
+
+def parse_bullets(text):
+    lines = [line.strip("-*• ").strip() for line in text.splitlines() if line.strip()]
+    parsed = []
+    for line in lines:
+        if ":" in line:
+            name, desc = line.split(":", 1)
+            # Remove common markdown formatting
+            clean_name = re.sub(r"\*+", "", name).strip()
+            clean_desc = re.sub(r"\*+", "", desc).strip()
+            parsed.append({"name": clean_name, "description": clean_desc})
+    return parsed
+
+@contextmanager
+def embedding_slot(timer, deadline, queue_stage):
+    with admission_slot("embedding", deadline) as waited:
+        timer.record(queue_stage, waited)
+        yield
+
+def retrieve_documents(retrieval_pipeline, text, timer, deadline, prefix="", top_k=None, abandoned=None, cache=True):
+    """Embed ``text`` and retrieve for it; returns ``(docs, query_embedding)``.
+
+    History-enriched texts are passed with ``cache=False``: they almost
+    never repeat and would only evict reusable entries. A speculative call
+    whose result is no longer wanted (``abandoned`` set) returns None before
+    taking an embedding slot, once it is admitted to one, and before
+    querying Chroma.
+    """
+    # Components are run one by one so the embedder and Chroma are timed separately
+    query_embedding = retrieval_pipeline.cached_embedding(text) if cache else None
+    if query_embedding is None:
+        if abandoned is not None and abandoned.is_set():
+            return None
+        with embedding_slot(timer, deadline, f"{prefix}embedding_queue"):
+            # It may have been abandoned while queued; give the slot back without encoding
+            if abandoned is not None and abandoned.is_set():
+                return None
+            with timer.stage(f"{prefix}embedding"):
+                query_embedding = retrieval_pipeline.embed(text, cache=cache)
+    if abandoned is not None and abandoned.is_set():
+        return None
+    with timer.stage(f"{prefix}retrieval"):
+        retrieved_docs = retrieval_pipeline.retrieve(text, query_embedding, top_k, cache=cache)
+    return [doc for doc in retrieved_docs if getattr(doc, "content", None)], query_embedding
+
+def get_diversity_options(validated_data):
+    config = {**DEFAULT_MMR, **getattr(settings, "RAG_MMR", {})}
+    requested = any(key in validated_data for key in ("mmr_lambda", "mmr_k", "per_file_limit"))
+    if not (config["enabled"] or requested):
+        return None
+    k = validated_data.get("mmr_k", config["k"])
+    return {
+        "lambda": validated_data.get("mmr_lambda", config["lambda"]),
+        "k": k,
+        "per_file_limit": validated_data.get("per_file_limit", config["per_file_limit"]),
+        "fetch_k": k * config["fetch_factor"],
+    }
+
+def build_retrieval_context(query, conversation, timer, deadline):
+    """The query enriched with history keywords, or the bare query when they add nothing to it."""
+    history_summary = conversation.summary
+    if not history_summary:
+        return query
+
+    with timer.stage("keywords"):
+        keywords = conversation.keywords(
+            lambda texts: extract_keywords(texts, encode_slot=lambda: embedding_slot(timer, deadline, "keywords_queue"))
+        )
+    lowered = query.casefold()
+    new_keywords = [keyword for keyword in keywords if keyword.casefold() not in lowered]
+    if not new_keywords:
+        return query
+    keyword_hint = ", ".join(new_keywords)
+    return f"Keyword Hints: {keyword_hint}\nConversation Summary: {history_summary}\nQuery: {query}"
+
+def retrieve_with_history(retrieval_pipeline, query, conversation, timer, deadline, top_k=None):
+    """Retrieve for the raw query speculatively while the history enrichment is built.
+
+    Only the branch whose result is used is waited on. The other one is
+    abandoned: cancelled if it has not started, otherwise it stops before
+    its next embedding slot or Chroma call.
+    """
+    abandoned = threading.Event()
+    speculative = None
+    if SPECULATIVE_RETRIEVAL:
+        speculative = speculation_pool.submit(
+            follow(retrieve_documents), retrieval_pipeline, query, timer, deadline, "speculative_", top_k, abandoned
+        )
+    try:
+        retrieval_context = build_retrieval_context(query, conversation, timer, deadline)
+        if retrieval_context != query:
+            if speculative is not None:
+                SPECULATION_OUTCOMES.inc(outcome="discarded")
+            return retrieve_documents(retrieval_pipeline, retrieval_context, timer, deadline, top_k=top_k, cache=False)
+        if speculative is None:
+            return retrieve_documents(retrieval_pipeline, query, timer, deadline, top_k=top_k)
+        SPECULATION_OUTCOMES.inc(outcome="reused")
+        return speculative.result()
+    finally:
+        abandoned.set()
+        if speculative is not None:
+            speculative.cancel()
+
+def answer_query(query, embedding, conversation, timer, deadline, diversity=None):
+    """Run retrieval and generation for one query.
+
+    The result holds only plain data so it can be shared between coalesced
+    requests, including across worker processes.
+    """
+    generation_pipeline = get_generation_pipeline()
+
+    history_summary = conversation.summary
+    retrieval_pipeline = get_retrieval_pipeline(embedding)
+
+    # MMR needs a wider candidate pool than the final number of chunks
+    top_k = diversity["fetch_k"] if diversity else None
+    if history_summary:
+        valid_docs, query_embedding = retrieve_with_history(
+            retrieval_pipeline, query, conversation, timer, deadline, top_k
+        )
+    else:
+        # Nothing to enrich the query with: one embedding, on this thread
+        valid_docs, query_embedding = retrieve_documents(retrieval_pipeline, query, timer, deadline, top_k=top_k)
+
+    if diversity:
+        with timer.stage("mmr"):
+            valid_docs = mmr_select(
+                query_embedding, valid_docs, diversity["k"], diversity["lambda"], diversity["per_file_limit"]
+            )
+    DOCUMENTS_RETRIEVED.observe(len(valid_docs), embedding=embedding)
+
+    if not valid_docs:
+        return None
+
+    with timer.stage("context"):
+        context = build_context(valid_docs, GENERATION_MODEL)
+
+    prompt_template = f"""
+        You are a helpful assistant that answers user questions using the provided documents and extracts structured metadata.
+
+        Conversation Summary:
+        {history_summary if history_summary else ''}
+
+        Documents:
+        {context}
+
+        Task:
+        Answer the following query concisely.
+
+        Then provide three lists:
+        - Locations: A list of locations mentioned, with short descriptions.
+        - Time Periods: A list of historical time periods mentioned, with short descriptions.
+        - Rulers or Polities: A list of historical rulers, governments, or kingdoms mentioned, with short descriptions.
+
+        Query: {query}
+    """
+
+    prompt_messages = [ChatMessage.from_system(prompt_template)]
+    prompt_messages.append(ChatMessage.from_user(f"User Query: {query}"))
+    PROMPT_TOKENS.observe(sum(estimate_tokens(message.text) for message in prompt_messages), embedding=embedding)
+
+    with admission_slot("generation", deadline) as waited:
+        timer.record("generation_queue", waited)
+        with timer.stage("generation"):
+            generation_result = generation_pipeline.run({"generator": {"messages": prompt_messages}})
+    llm_output = generation_result["generator"]["replies"][0].text.strip()
+    parse_started = time.perf_counter()
+
+    # Extract using labeled sections instead of JSON
+    # logger.info(f"LLM output: {llm_output}")
+    conversational_answer = llm_output.split("Locations:")[0].strip()
+    conversational_answer = "\n".join([
+        re.sub(r"[^\w\s.,:;!?()-]", "", line).strip()
+        for line in conversational_answer.splitlines()
+        if line.strip()
+    ])
+
+    structured_data = {
+        "structured_locations": parse_bullets(extract_section(llm_output, "Locations")),
+        "structured_time_periods": parse_bullets(extract_section(llm_output, "Time Periods")),
+        "structured_rulers_or_polities": parse_bullets(extract_section(llm_output, "Rulers or Polities")),
+    }
+    timer.record("parsing", time.perf_counter() - parse_started)
+
+    return {
+        "answer": conversational_answer,
+        "llm_output": llm_output,
+        "structured_data": structured_data,
+        "documents": [
+            {
+                "id": doc.id,
+                "score": doc.score,
+                "content": doc.content,
+                "file_path": doc.meta.get("file_path", "Unknown")
+            }
+            for doc in valid_docs
+        ],
+    }
+
 class RAGQueryAPIView(APIView):
     def post(self, request, *args, **kwargs):
         if getattr(settings, "USE_MOCK_RAG_RESPONSE", False):
+            mock_content = "This is a mock document about the founding of Rome by Romulus in 753 BC."
             mock_data = {
                 "answer": "Mock answer: Rome was founded in 753 BC.",
+                "embedding": request.data.get("embedding", "e5"),
                 "retrieved_documents": [
-                    {"score": 0.98, "file_path": "Legendary_Rome.pdf"}
-                ],
-                "full_document_contents": [
-                    "This is a mock document about the founding of Rome by Romulus in 753 BC."
+                    {"id": "mock-rome", "score": 0.98, "content_snippet": mock_content[:SNIPPET_CHARS],
+                        "truncated": len(mock_content) > SNIPPET_CHARS, "file_path": "Legendary_Rome.pdf"}
                 ],
+                "full_document_contents": [mock_content],
                 "structured_locations": [
                     {"name": "Rome", "description": "Capital of ancient Rome, traditionally founded in 753 BC."}
                 ],
@@ -92,165 +308,123 @@ class RAGQueryAPIView(APIView):
             }
             return Response(mock_data)
 
+        timer = StageTimer()
+        profile = profile_name = None
+        try:
+            profile = start_request_profile(request)
+            response = self.handle_query(request, timer)
+        finally:
+            timer.finish()
+            if profile is not None:
+                profile_name = profile.finish()
+        response["Server-Timing"] = timer.server_timing()
+        if profile_name:
+            response["X-Profile-Id"] = profile_name
+        return response
+
+    def handle_query(self, request, timer):
         serializer = QuerySerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         query = serializer.validated_data["query"]
         embedding = serializer.validated_data.get("embedding", "e5")
+        compact = serializer.validated_data.get("compact", COMPACT_RESPONSES)
+        timer.embedding = embedding
 
-        guest_user, _ = User.objects.get_or_create(username="guest")
+        with timer.stage("history"):
+            conversation = get_conversation(request)
         logger.info(f"Received query: {query} using embedding: {embedding}")
 
         try:
-            generation_pipeline = get_generation_pipeline()
-
-            history_entries = ChatMessageHistory.objects.filter(user=guest_user).order_by("-timestamp")[:6][::-1]
-            qa_pairs = []
-            for entry in history_entries:
-                if entry.role == "user":
-                    qa_pairs.append({"user": entry.content})
-                elif entry.role == "assistant" and qa_pairs:
-                    qa_pairs[-1]["assistant"] = entry.content
-            qa_pairs = qa_pairs[-3:]
-
-            history_summary = "\n".join([
-                f"Q: {pair['user']}\nA: {pair.get('assistant', '')}" for pair in qa_pairs
-            ])
-
-            recent_questions = [pair["user"] for pair in qa_pairs]
-            keywords = extract_keywords(recent_questions) if recent_questions else []
-            keyword_hint = ", ".join(keywords)
-            retrieval_context = f"Keyword Hints: {keyword_hint}\nConversation Summary: {history_summary}\nQuery: {query}" if keyword_hint or history_summary else query
-
-            retrieval_pipeline = get_retrieval_pipeline(embedding)
-            retrieval_results = retrieval_pipeline.run({"embedder": {"text": retrieval_context}})
-            retrieved_docs = retrieval_results["retriever"]["documents"]
-            valid_docs = [doc for doc in retrieved_docs if getattr(doc, "content", None)]
-
-            if not valid_docs:
-                return Response({
+            diversity = get_diversity_options(serializer.validated_data)
+            key = coalescing_key(query, embedding, conversation.summary, diversity)
+            started = time.perf_counter()
+            deadline = request_deadline()
+            result, shared = single_flight.do(
+                key, lambda: answer_query(query, embedding, conversation, timer, deadline, diversity), deadline
+            )
+            if shared:
+                logger.info(f"Coalesced query with an in-flight request: {query}")
+                timer.record("coalesced_wait", time.perf_counter() - started)
+                CACHE_HITS.inc(cache="coalesce")
+            else:
+                CACHE_MISSES.inc(cache="coalesce")
+
+            if result is None:
+                response_data = {
                     "answer": "No relevant documents found.",
                     "retrieved_documents": [],
-                    "full_document_contents": [],
                     "structured_locations": [],
                     "structured_time_periods": [],
                     "structured_rulers_or_polities": [],
-                    "raw_llm_output": "",
-                    "chat_history": []
-                })
-
-            doc_texts = [doc.content[:1000] for doc in valid_docs]
-            context = "\n---\n".join(doc_texts)
-
-            prompt_template = f"""
-                You are a helpful assistant that answers user questions using the provided documents and extracts structured metadata.
-
-                Conversation Summary:
-                {history_summary if history_summary else ''}
-
-                Documents:
-                {context}
-
-                Task:
-                Answer the following query concisely.
-
-                Then provide three lists:
-                - Locations: A list of locations mentioned, with short descriptions.
-                - Time Periods: A list of historical time periods mentioned, with short descriptions.
-                - Rulers or Polities: A list of historical rulers, governments, or kingdoms mentioned, with short descriptions.
-
-                Query: {query}
-            """
-
-            prompt_messages = [ChatMessage.from_system(prompt_template)]
-            prompt_messages.append(ChatMessage.from_user(f"Context:\n{context}\n\nUser Query: {query}"))
-
-            generation_result = generation_pipeline.run({"generator": {"messages": prompt_messages}})
-            llm_output = generation_result["generator"]["replies"][0].text.strip()
-
-            structured_data = {
-                "structured_locations": [],
-                "structured_time_periods": [],
-                "structured_rulers_or_polities": [],
-            }
-
-            # Extract using labeled sections instead of JSON
-            # logger.info(f"LLM output: {llm_output}")
-            conversational_answer = llm_output.split("Locations:")[0].strip()
-            conversational_answer = "\n".join([
-                re.sub(r"[^\w\s.,:;!?()-]", "", line).strip()
-                for line in conversational_answer.splitlines()
-                if line.strip()
-            ])
-
-            def extract_section(label):
-                pattern = rf"{label}:\s*(.*?)(?:\n\w+:|$)"
-                match = re.search(pattern, llm_output, re.DOTALL | re.IGNORECASE)
-                return match.group(1).strip() if match else ""
-
-            def parse_bullets(text):
-                lines = [line.strip("-*• ").strip() for line in text.splitlines() if line.strip()]
-                parsed = []
-                for line in lines:
-                    if ":" in line:
-                        name, desc = line.split(":", 1)
-                        # Remove common markdown formatting
-                        clean_name = re.sub(r"\*+", "", name).strip()
-                        clean_desc = re.sub(r"\*+", "", desc).strip()
-                        parsed.append({"name": clean_name, "description": clean_desc})
-                return parsed
-
-
-            structured_data["structured_locations"] = parse_bullets(extract_section("Locations"))
-            structured_data["structured_time_periods"] = parse_bullets(extract_section("Time Periods"))
-            structured_data["structured_rulers_or_polities"] = parse_bullets(extract_section("Rulers or Polities"))
-
-            ChatMessageHistory.objects.create(user=guest_user, role="user", content=query, embedding=embedding)
-            ChatMessageHistory.objects.create(
-                user=guest_user,
-                role="assistant",
-                content=llm_output,
-                embedding=embedding,
-                structured_data=structured_data,
-                retrieved_documents=[
-                    {
-                        "id": doc.id, 
-                        "score": doc.score, 
-                        "content": doc.content[:300], 
-                        "file_path": doc.meta.get("file_path", "Unknown")
-                    }
-                    for doc in valid_docs
-                ]
-            )
-
-            chat_display = []
-            for pair in qa_pairs:
-                chat_display.append({"role": "user", "content": pair["user"]})
-                if "assistant" in pair:
-                    chat_display.append({"role": "assistant", "content": pair["assistant"]})
+                }
+                if not compact:
+                    response_data.update({"full_document_contents": [], "raw_llm_output": "", "chat_history": []})
+                return Response(response_data)
+
+            documents = result["documents"]
+            llm_output = result["llm_output"]
+            structured_data = result["structured_data"]
+
+            chat_display = conversation.display()
+            with timer.stage("persist"):
+                conversation.append(
+                    query,
+                    llm_output,
+                    embedding=embedding,
+                    structured_data=structured_data,
+                    retrieved_documents=[
+                        {
+                            "id": doc["id"], 
+                            "score": doc["score"], 
+                            "content": doc["content"][:300], 
+                            "file_path": doc["file_path"]
+                        }
+                        for doc in documents
+                    ],
+                )
 
             chat_display.append({"role": "user", "content": query})
-            chat_display.append({"role": "assistant", "content": conversational_answer})
+            chat_display.append({"role": "assistant", "content": result["answer"]})
+
+            if compact:
+                # Full text is fetched per document from documents/<id>/ when the user expands it
+                response_data = {
+                    "answer": result["answer"],
+                    "embedding": embedding,
+                    "retrieved_documents": DocumentMetadataSerializer([
+                        {"id": doc["id"], "score": doc["score"],
+                            "content_snippet": doc["content"][:SNIPPET_CHARS],
+                            "truncated": len(doc["content"]) > SNIPPET_CHARS, "file_path": doc["file_path"]}
+                        for doc in documents
+                    ], many=True).data,
+                    **structured_data,
+                }
+                return Response(response_data)
 
             response_data = {
-                "answer": conversational_answer,
+                "answer": result["answer"],
                 "retrieved_documents": [
-                    {"id": doc.id, "score": doc.score,
-                        "file_path": doc.meta.get("file_path", "Unknown")} for doc in valid_docs
+                    {"id": doc["id"], "score": doc["score"],
+                        "file_path": doc["file_path"]} for doc in documents
                 ],
-                "full_document_contents": [doc.content for doc in valid_docs],
+                "full_document_contents": [doc["content"] for doc in documents],
                 **structured_data,
                 "raw_llm_output": llm_output,
                 "chat_history": chat_display
             }
 
             # logger.info("RAG query successful")
-            # logger.info(f"Answer: {conversational_answer}")
+            # logger.info(f"Answer: {result['answer']}")
             # logger.info(f"Structured data: {structured_data}")
 
             return Response(response_data)
 
+        except Overloaded as e:
+            logger.warning(f"Shed query: {e}")
+            return Response({"error": str(e)}, status=e.status, headers={"Retry-After": str(e.retry_after)})
+
         except Exception as e:
             logger.exception("RAG query failed")
             return Response({"error": str(e)}, status=500)
@@ -259,6 +433,58 @@ class ClearChatAPIView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request, *args, **kwargs):
-        guest_user, _ = User.objects.get_or_create(username="guest")
-        ChatMessageHistory.objects.filter(user=guest_user).delete()
-        return Response({"message": "Chat history cleared."})
\ No newline at end of file
+        get_conversation(request).clear().result()
+        return Response({"message": "Chat history cleared."})
+
+class DocumentDetailAPIView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, doc_id, *args, **kwargs):
+        embedding = request.query_params.get("embedding", "e5")
+        if embedding not in settings.EMBEDDING_MODELS:
+            return Response({"error": "Invalid embedding type"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # A published store version is never rewritten, so its version and the id pin the body.
+        # Unversioned stores can be rebuilt in place, so there the body itself is hashed.
+        version = get_retrieval_pipeline(embedding).version
+        etag = f'"{embedding}-{version}-{doc_id}"' if version else None
+        if etag and etag in parse_etags(request.headers.get("If-None-Match", "")):
+            CACHE_HITS.inc(cache="document_etag")
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=self.cache_headers(etag))
+
+        doc = fetch_document(embedding, doc_id)
+        if doc is None:
+            raise Http404("Document not found")
+        body = {
+            "id": doc.id,
+            "content": doc.content,
+            "file_path": doc.meta.get("file_path", "Unknown"),
+            "source_file_paths": doc.meta.get("source_file_paths"),
+        }
+        if etag is None:
+            digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+            etag = f'"{embedding}-{digest}"'
+            if etag in parse_etags(request.headers.get("If-None-Match", "")):
+                CACHE_HITS.inc(cache="document_etag")
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=self.cache_headers(etag))
+        CACHE_MISSES.inc(cache="document_etag")
+        return Response(body, headers=self.cache_headers(etag))
+
+    @staticmethod
+    def cache_headers(etag):
+        return {"ETag": etag, "Cache-Control": f"private, max-age={DOCUMENT_CACHE_MAX_AGE}"}
+
+class MetricsAPIView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+class ProfileDownloadAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, name, *args, **kwargs):
+        path = get_profile_path(name)
+        if path is None:
+            raise Http404("Profile not found")
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=name)
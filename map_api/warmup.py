@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import ChatMessageHistory
+from .retrieval import get_retrieval_pipeline, query_cache_key
+from .diversify import DEFAULT_MMR
+from .admission import Overloaded, admission_slot, request_deadline
+
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+import logging
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; workers then warm up concurrently
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WARMUP = {
+    "on_start": False,
+    "background": True,  # Warm in a thread so the worker starts serving straight away
+    "history_days": 14,
+    "max_history_queries": 500,
+    "question_dir": "./data/input",
+    "max_file_questions": 500,
+    "embeddings": None,  # None = every model in EMBEDDING_MODELS
+    "lock_file": "./data/run/warmup.lock",  # Workers on one host warm up one at a time
+}
+
+
+def get_warmup_config(**overrides):
+    config = {**DEFAULT_WARMUP, **getattr(settings, "RAG_WARMUP", {})}
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    return config
+
+
+def frequent_history_queries(days, limit):
+    """Most frequent user queries of the last ``days`` days as ``{embedding: [(query, count)]}``.
+
+    Also returns the total number of user queries in the window, for coverage.
+    """
+    recent = ChatMessageHistory.objects.filter(role="user", timestamp__gte=timezone.now() - timedelta(days=days))
+    rows = recent.values("content", "embedding").annotate(count=Count("id")).order_by("-count")[:limit]
+    queries = {}
+    for row in rows:
+        queries.setdefault(row["embedding"], []).append((row["content"].strip(), row["count"]))
+    return queries, recent.count()
+
+
+def file_questions(question_dir, limit):
+    questions = []
+    directory = Path(question_dir)
+    for path in sorted(directory.glob("*.txt")) if directory.is_dir() else []:
+        with open(path, "r", encoding="utf-8") as f:
+            questions.extend(line.strip() for line in f if line.strip())
+    return list(dict.fromkeys(questions))[:limit]
+
+
+def served_top_ks():
+    # The retrieval cache is keyed by top_k, so replay every value rag-query asks for
+    mmr = {**DEFAULT_MMR, **getattr(settings, "RAG_MMR", {})}
+    return [None, mmr["k"] * mmr["fetch_factor"]] if mmr["enabled"] else [None]
+
+
+def warm_caches(**overrides):
+    """Replay frequent recent and file questions through the embedders and retrievers.
+
+    Returns a per-model report of time taken, queries replayed and how much
+    of the recent query volume and cache capacity they cover.
+    """
+    config = get_warmup_config(**overrides)
+    started = time.perf_counter()
+    history, history_total = frequent_history_queries(config["history_days"], config["max_history_queries"])
+    questions = file_questions(config["question_dir"], config["max_file_questions"])
+    top_ks = served_top_ks()
+
+    report = {}
+    for embedding in config["embeddings"] or list(settings.EMBEDDING_MODELS):
+        model_started = time.perf_counter()
+        pipeline = get_retrieval_pipeline(embedding)
+        load_seconds = time.perf_counter() - model_started
+
+        weighted = history.get(embedding, [])
+        texts = list(dict.fromkeys([query for query, _ in weighted] + questions))
+        replayed, failed, busy = set(), 0, 0
+        for text in texts:
+            try:
+                query_embedding = pipeline.embedding_cache.get(query_cache_key(text))
+                if query_embedding is None:
+                    # Encodes share the embedding stage with live traffic and give way when it is saturated
+                    with admission_slot("embedding", request_deadline()):
+                        query_embedding = pipeline.embed(text)
+                for top_k in top_ks:
+                    pipeline.retrieve(text, query_embedding, top_k)
+                replayed.add(text)
+            except Overloaded:
+                busy += 1
+            except Exception:
+                failed += 1
+                logger.warning(f"Warm-up query failed for {embedding}: {text[:80]}", exc_info=True)
+
+        # Cached entries can already be evicted again if the caches are smaller than the replay set
+        cached = {text for text, _ in pipeline.retrieval_cache.keys()}
+        covered = sum(count for query, count in weighted if query_cache_key(query) in cached)
+        report[embedding] = {
+            "seconds": round(time.perf_counter() - model_started, 2),
+            "model_load_seconds": round(load_seconds, 2),
+            "history_queries": len(weighted),
+            "file_questions": len(questions),
+            "replayed": len(replayed),
+            "failed": failed,
+            "skipped_busy": busy,
+            "history_coverage": round(covered / history_total, 3) if history_total else None,
+            "embedding_cache": f"{len(pipeline.embedding_cache)}/{pipeline.embedding_cache.max_size}",
+            "retrieval_cache": f"{len(pipeline.retrieval_cache)}/{pipeline.retrieval_cache.max_size}",
+        }
+        logger.info(f"Warmed {embedding}: {report[embedding]}")
+
+    logger.info(f"Cache warm-up finished in {time.perf_counter() - started:.1f}s")
+    return report
+
+
+@contextmanager
+def _one_worker_at_a_time(lock_file):
+    if not lock_file or fcntl is None:
+        yield
+        return
+    path = Path(lock_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def warm_up_on_start():
+    """Called when a worker loads the WSGI/ASGI application; a no-op unless RAG_WARMUP["on_start"].
+
+    The caches are per process, so every worker warms its own, but the
+    workers on a host take turns so that only one runs encodes at a time.
+    """
+    config = get_warmup_config()
+    if not config["on_start"]:
+        return
+
+    def run():
+        try:
+            with _one_worker_at_a_time(config["lock_file"]):
+                warm_caches()
+        except Exception:
+            logger.exception("Cache warm-up at worker start failed")
+
+    if config["background"]:
+        threading.Thread(target=run, name="cache-warmup", daemon=True).start()
+    else:
+        run()
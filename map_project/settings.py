@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'django.middleware.gzip.GZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +84,27 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# "shared" is seen by every worker on the host. Sessions live there rather than
+# in the database, and so do the conversation versions (map_api.conversation).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': './data/run/cache',
+        'TIMEOUT': 14 * 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+SESSION_CACHE_ALIAS = 'shared'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -185,15 +207,140 @@ LOGGING = {
     },
 }
 
+# chunk_tokens/chunk_overlap_tokens size token-aware chunks for each model's sequence
+# window (mpnet: 384, e5-large-v2: 512); split_length/split_overlap are the sentence mode.
+# shards > 1 partitions the store by shard_key ("file" or "chunk") at ingest; see
+# `manage.py rebalance_shards` to reshard an existing store.
 EMBEDDING_MODELS = {
     "mpnet": {
         "name": "sentence-transformers/all-mpnet-base-v2",
-        "path": "./data/chroma_db"
+        "path": "./data/chroma_db",
+        "chunk_tokens": 320,
+        "chunk_overlap_tokens": 32,
+        "split_length": 10,
+        "split_overlap": 0,
+        "distance_function": "cosine",
+        "shards": 1,
+        "shard_key": "file",
+        # Compact first-pass index written at ingest (map_api.quantization), e.g.
+        # {"method": "int8"} or {"method": "pca", "dims": 256, "rescore_factor": 4}.
+        # Its first pass is a brute-force scan that replaces Chroma's HNSW search. It saves
+        # RAM, not disk: the codes are written beside Chroma's float32 vectors and HNSW files.
+        "compression": None,
     },
     "e5": {
         "name": "intfloat/e5-large-v2",
-        "path": "./data/chroma_db_e5_embeddings"
+        "path": "./data/chroma_db_e5_embeddings",
+        "chunk_tokens": 480,
+        "chunk_overlap_tokens": 48,
+        "split_length": 10,
+        "split_overlap": 2,
+        "distance_function": "l2",
+        "shards": 1,
+        "shard_key": "file",
+        "compression": None,
     }
 }
 
-USE_MOCK_RAG_RESPONSE = False  # Set to False when you want to use the real pipeline
\ No newline at end of file
+USE_MOCK_RAG_RESPONSE = False  # Set to False when you want to use the real pipeline
+# Per-session chat history kept in memory by each worker (map_api.conversation);
+# CONVERSATION_CACHE names the cache the workers share conversation versions through
+CONVERSATION_CACHE = "shared"
+CONVERSATION_MAX_TURNS = 3
+CONVERSATION_MAX_SESSIONS = 1000
+
+# Chat history retention (map_api.retention, `manage.py prune_chat_history`)
+CHAT_HISTORY_RETENTION = {
+    "max_turns_per_user": 50,
+    "max_age_days": 90,
+    "compact_after_days": 7,  # Older answers are replaced by one summary row per conversation
+    "archive_dir": "./data/archive/chat_history",
+    "incremental_every": 50,  # Sweep the conversations written since the last sweep after this many turns; 0 disables
+}
+
+GENERATION_MODEL = "gemini-1.5-flash"
+
+# Approximate prompt tokens spent on retrieved passages, per generation model (map_api.context)
+CONTEXT_TOKEN_BUDGETS = {
+    "gemini-1.5-flash": 3000,
+    "default": 3000,
+}
+
+# Share one computation between identical concurrent rag-query requests (map_api.coalesce)
+RAG_COALESCING = {
+    "enabled": True,
+    "cross_process": False,  # Also coalesce across workers via lock files in lock_dir
+    "lock_dir": "./data/run/singleflight",
+    "result_ttl": 5.0,
+    "poll_interval": 0.05,
+    "prune_interval": 60.0,  # Seconds between sweeps of stale lock and result files
+}
+
+# "gemini" or "local"; the local stand-in (map_api.local_generator) is for load tests
+GENERATOR_BACKEND = "gemini"
+LOCAL_GENERATOR = {
+    "latency_median": 0.8,  # Seconds to first token (log-normal median)
+    "latency_sigma": 0.35,
+    "tokens_per_second": 80.0,
+}
+
+# On-demand rag-query profiling (map_api.profiling). Staff can send the header to
+# profile one request; profiles are downloaded from /api/profiles/<X-Profile-Id>/
+RAG_PROFILING = {
+    "header": "X-Profile-Request",
+    "sample_rate": 0.0,  # Fraction of all requests to profile
+    "mode": "sampling",  # "sampling" writes flamegraph .folded stacks, "cprofile" writes .prof
+    "interval": 0.005,
+    "profile_dir": "./data/profiles",
+    "max_profiles": 200,
+}
+
+# Per-stage concurrency limits for rag-query (map_api.admission). Requests that
+# cannot get a slot before the deadline are shed with 429/503 and Retry-After.
+RAG_ADMISSION = {
+    "enabled": True,
+    "deadline": 15.0,  # Seconds a request may spend waiting for stage slots
+    "stages": {
+        "embedding": {"max_concurrent": 2, "max_queue": 16},
+        "generation": {"max_concurrent": 8, "max_queue": 32},
+    },
+}
+
+# Retrieve for the raw query in parallel with history/keyword enrichment (map_api.views)
+RAG_SPECULATIVE_RETRIEVAL = True
+RAG_SPECULATION_WORKERS = 4
+
+# Seconds between checks for a newly published vector store version (map_api.retrieval); 0 disables
+VECTOR_STORE_RELOAD_INTERVAL = 30
+
+# Maximal marginal relevance over retrieved chunks (map_api.diversify). Requests can
+# also opt in per call with mmr_lambda, mmr_k and per_file_limit.
+RAG_MMR = {
+    "enabled": False,
+    "lambda": 0.7,  # 1.0 = pure relevance, 0.0 = pure diversity
+    "k": 10,
+    "per_file_limit": 3,
+    "fetch_factor": 3,  # Candidates fetched per selected chunk
+}
+
+# Lean rag-query responses: ids, scores and snippets, with full text fetched
+# from documents/<id>/ on demand. Requests can override this with "compact".
+RAG_COMPACT_RESPONSES = False
+RAG_SNIPPET_CHARS = 300
+DOCUMENT_CACHE_MAX_AGE = 86400  # Seconds browsers may reuse a documents/<id>/ response
+
+# Per-worker LRU caches in front of the query embedder and retriever (map_api.retrieval)
+QUERY_EMBEDDING_CACHE_SIZE = 2048
+RETRIEVAL_CACHE_SIZE = 512
+
+# Cache warm-up from frequent recent queries and data/input question files
+# (map_api.warmup, `manage.py warm_caches`); on_start runs it as each worker loads
+RAG_WARMUP = {
+    "on_start": False,
+    "background": True,
+    "history_days": 14,
+    "max_history_queries": 500,
+    "question_dir": "./data/input",
+    "max_file_questions": 500,
+    "lock_file": "./data/run/warmup.lock",  # Workers on one host warm up one at a time
+}
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'map_project.settings')
 
 application = get_wsgi_application()
+
+# Optionally replay frequent queries into the embedding/retrieval caches (settings.RAG_WARMUP)
+from map_api.warmup import warm_up_on_start  # noqa: E402
+
+warm_up_on_start()
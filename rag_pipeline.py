@@ -1,11 +1,13 @@
 from haystack import Pipeline
 from haystack_integrations.document_stores.chroma import ChromaDocumentStore
 from haystack.components.embedders import SentenceTransformersTextEmbedder
-from haystack_integrations.components.retrievers.chroma import ChromaEmbeddingRetriever
 import logging
 import os
 from datetime import datetime
 from sentence_transformers import CrossEncoder
+from map_api.store_versions import resolve_store_path
+from map_api.sharding import build_retriever, existing_shard_paths
+from map_api.diversify import mmr_select
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -15,8 +17,15 @@ logger = logging.getLogger(__name__)
 CHHROMA_SAVEPATH = "./data/chroma_db"
 timestamp_str = datetime.now().strftime("%Y%m%d-%H%M%S")
 
+# MMR diversification of the retrieved chunks
+USE_MMR = False  # Opt in; MMR changes which chunks the batch outputs are built from
+MMR_LAMBDA = 0.7
+PER_FILE_LIMIT = 2
+MMR_FETCH_FACTOR = 3
+
 # Chroma store
-ds = ChromaDocumentStore(persist_path=CHHROMA_SAVEPATH, distance_function="cosine")
+store_paths = existing_shard_paths(resolve_store_path(CHHROMA_SAVEPATH))
+stores = [ChromaDocumentStore(persist_path=path, distance_function="cosine") for path in store_paths]
 
 cross_encoder = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
 
@@ -31,7 +40,7 @@ def rerank_by_crossencoder(query, docs, top_k=5):
 
 # Components
 embedder = SentenceTransformersTextEmbedder(model="sentence-transformers/all-mpnet-base-v2")
-retriever = ChromaEmbeddingRetriever(document_store=ds)
+retriever = build_retriever(stores, store_paths)
 
 # Pipeline
 pipeline = Pipeline()
@@ -55,8 +64,18 @@ def run_queries(path="./data/input/questions.txt", top_k=10):
         for i, query in enumerate(queries, 1):
             logger.info(f"[{i}/{len(queries)}] Query: {query}")
             try:
-                result = pipeline.run({"embedder": {"text": query}})
-                documents = result["retriever"]["documents"]
+                if USE_MMR:
+                    result = pipeline.run(
+                        {"embedder": {"text": query}, "retriever": {"top_k": top_k * MMR_FETCH_FACTOR}},
+                        include_outputs_from={"embedder"},
+                    )
+                    documents = mmr_select(
+                        result["embedder"]["embedding"], result["retriever"]["documents"],
+                        top_k, MMR_LAMBDA, PER_FILE_LIMIT
+                    )
+                else:
+                    result = pipeline.run({"embedder": {"text": query}})
+                    documents = result["retriever"]["documents"]
                 out.write(f"Query: {query}\n")
                 for idx, doc in enumerate(documents[:top_k]):
                     out.write(f"\nDocument {idx+1} (Score: {doc.score:.4f})\n")
@@ -1,7 +1,9 @@
 from haystack import Pipeline
 from haystack_integrations.document_stores.chroma import ChromaDocumentStore
 from haystack.components.embedders import SentenceTransformersTextEmbedder
-from haystack_integrations.components.retrievers.chroma import ChromaEmbeddingRetriever
+from map_api.store_versions import resolve_store_path
+from map_api.sharding import build_retriever, existing_shard_paths
+from map_api.diversify import mmr_select
 import logging
 import os
 from datetime import datetime
@@ -14,13 +16,20 @@ logger = logging.getLogger(__name__)
 CHROMA_SAVEPATH = "./data/chroma_db_e5_embeddings"
 timestamp_str = datetime.now().strftime("%Y%m%d-%H%M%S")
 
+# MMR diversification of the retrieved chunks
+USE_MMR = False  # Opt in; MMR changes which chunks the batch outputs are built from
+MMR_LAMBDA = 0.7
+PER_FILE_LIMIT = 2
+MMR_FETCH_FACTOR = 3
+
 # Chroma store
-ds = ChromaDocumentStore(persist_path=CHROMA_SAVEPATH, distance_function="cosine")
+store_paths = existing_shard_paths(resolve_store_path(CHROMA_SAVEPATH))
+stores = [ChromaDocumentStore(persist_path=path, distance_function="cosine") for path in store_paths]
 
 
 # Components
 embedder = SentenceTransformersTextEmbedder(model="intfloat/e5-large-v2")
-retriever = ChromaEmbeddingRetriever(document_store=ds)
+retriever = build_retriever(stores, store_paths)
 
 # Pipeline
 pipeline = Pipeline()
@@ -44,8 +53,18 @@ def run_queries(path="./data/input/questions - all.txt", top_k=10):
         for i, query in enumerate(queries, 1):
             logger.info(f"[{i}/{len(queries)}] Query: {query}")
             try:
-                result = pipeline.run({"embedder": {"text": query}})
-                documents = result["retriever"]["documents"]
+                if USE_MMR:
+                    result = pipeline.run(
+                        {"embedder": {"text": query}, "retriever": {"top_k": top_k * MMR_FETCH_FACTOR}},
+                        include_outputs_from={"embedder"},
+                    )
+                    documents = mmr_select(
+                        result["embedder"]["embedding"], result["retriever"]["documents"],
+                        top_k, MMR_LAMBDA, PER_FILE_LIMIT
+                    )
+                else:
+                    result = pipeline.run({"embedder": {"text": query}})
+                    documents = result["retriever"]["documents"]
                 out.write(f"Query: {query}\n")
                 for idx, doc in enumerate(documents[:top_k]):
                     out.write(f"\nDocument {idx+1} (Score: {doc.score:.4f})\n")